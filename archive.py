@@ -0,0 +1,176 @@
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import date as date_type
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+import config
+import database
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within this process
+    fcntl = None
+
+# Columnar copy of the holdings history for backtests, partitioned by ETF and month:
+#
+#   {ARCHIVE_DIR}/etf=QQQI/month=2025-01/holdings.parquet
+#
+# save_holdings() adds each snapshot as it is stored by rewriting its month file (a few
+# thousand rows). Each file is a single row group sorted by date: ETF and month filters
+# skip whole files by path, other filters by the file's column statistics, and a scan
+# decodes a few large column chunks instead of many tiny per-day ones. Writers to a
+# month file hold its partition lock (a thread lock plus an flock on the dot-prefixed
+# .lock file beside it) across the read-modify-write, so concurrent saves from the bot and
+# main.py cannot drop each other's days, and the file is replaced atomically.
+#
+#   python archive.py export [ETF]   (re)build the archive from the database
+
+ARCHIVE_SCHEMA = pa.schema([
+    ('date', pa.date32()),
+    ('security_id', pa.int64()),
+    ('position', pa.int32()),
+    ('holding_ticker', pa.string()),
+    ('description', pa.string()),
+    ('shares', pa.float64()),
+    ('market_value', pa.float64()),
+    ('weight', pa.float64()),
+    ('asset_class', pa.string()),
+    ('strike_price', pa.float64()),
+    ('expiration_date', pa.string()),
+    ('option_type', pa.string()),
+])
+
+PARTITION_SCHEMA = pa.schema([('etf', pa.string()), ('month', pa.string())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+DATASET_SCHEMA = pa.unify_schemas([ARCHIVE_SCHEMA, PARTITION_SCHEMA])
+
+def _month_path(etf_ticker, date):
+    return os.path.join(config.ARCHIVE_DIR, f"etf={etf_ticker}", f"month={date[:7]}", "holdings.parquet")
+
+_partition_locks = {}
+_partition_locks_guard = threading.Lock()
+
+@contextmanager
+def _partition_lock(path):
+    """Hold the month file at `path` exclusively against other threads and processes."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with _partition_locks_guard:
+        thread_lock = _partition_locks.setdefault(directory, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _to_table(date, df):
+    """A snapshot frame (as passed to or returned by save/get_holdings) as an ARCHIVE_SCHEMA table."""
+    frame = pd.DataFrame({'date': date_type.fromisoformat(date), 'position': range(len(df))}, index=df.index)
+    for field in ARCHIVE_SCHEMA:
+        if field.name in frame.columns:
+            continue
+        values = df[field.name] if field.name in df.columns else None
+        if pa.types.is_floating(field.type) and values is not None:
+            values = pd.to_numeric(values, errors='coerce')
+        frame[field.name] = values
+    return pa.Table.from_pandas(frame[ARCHIVE_SCHEMA.names], schema=ARCHIVE_SCHEMA, preserve_index=False)
+
+def _write_month(path, table):
+    """
+    Write a month's rows sorted by date as one row group, replacing the file atomically.
+    Callers hold _partition_lock(path).
+    """
+    table = table.sort_by([('date', 'ascending'), ('position', 'ascending')])
+    # Dot-prefixed so a concurrent scan() never picks up the half-written file
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    pq.write_table(table, tmp_path, row_group_size=max(1, len(table)))
+    os.replace(tmp_path, path)
+
+def export_snapshot(etf_ticker, date, df=None):
+    """
+    Add (or replace) one snapshot in its ETF/month file. df defaults to the stored
+    snapshot; save_holdings passes the frame it just saved to skip the read.
+    """
+    if df is None:
+        df = database.get_holdings(date, etf_ticker)
+    path = _month_path(etf_ticker, date)
+    table = _to_table(date, df)
+    with _partition_lock(path):
+        if os.path.exists(path):
+            existing = pq.read_table(path, memory_map=True)
+            keep = ds.field('date') != pa.scalar(date_type.fromisoformat(date), pa.date32())
+            table = pa.concat_tables([ds.dataset(existing).to_table(filter=keep), table])
+        _write_month(path, table)
+
+def export_all(etf_ticker=None):
+    """Rebuild the archive for one or every ETF from the database, a month file at a time."""
+    snapshots = database.list_snapshots(etf_ticker)
+    months = {}
+    for snap in snapshots:
+        months.setdefault((snap['etf'], snap['date'][:7]), []).append(snap['date'])
+    for (etf, month), dates in sorted(months.items()):
+        tables = [_to_table(date, database.get_holdings(date, etf)) for date in dates]
+        path = _month_path(etf, dates[0])
+        with _partition_lock(path):
+            _write_month(path, pa.concat_tables(tables))
+    print(f"Archived {len(snapshots)} snapshots in {len(months)} month files")
+
+def _dataset():
+    # use_mmap: Parquet pages are read straight from the page cache instead of copied
+    filesystem = pafs.LocalFileSystem(use_mmap=True)
+    return ds.dataset(config.ARCHIVE_DIR, schema=DATASET_SCHEMA, format='parquet',
+                      partitioning=PARTITIONING, filesystem=filesystem)
+
+def scan(etfs=None, start=None, end=None, columns=None, where=None):
+    """
+    Read archived holdings as a pyarrow Table.
+
+    etfs: tickers to include (default all). start/end: inclusive 'YYYY-MM-DD' bounds.
+    columns: column names to read (default all, plus 'etf'). where: an extra
+    pyarrow.dataset expression, e.g. ds.field('asset_class') == 'Option'.
+    ETF and month bounds prune files by path, date bounds and `where` by the files'
+    column statistics, and only the requested columns are decoded.
+    """
+    if columns is None:
+        columns = ['etf'] + ARCHIVE_SCHEMA.names
+    if not os.path.isdir(config.ARCHIVE_DIR):
+        return DATASET_SCHEMA.empty_table().select(columns)
+
+    conditions = []
+    if etfs:
+        conditions.append(ds.field('etf').isin(list(etfs)))
+    if start:
+        conditions.append(ds.field('month') >= start[:7])
+        conditions.append(ds.field('date') >= pa.scalar(date_type.fromisoformat(start), pa.date32()))
+    if end:
+        conditions.append(ds.field('month') <= end[:7])
+        conditions.append(ds.field('date') <= pa.scalar(date_type.fromisoformat(end), pa.date32()))
+    if where is not None:
+        conditions.append(where)
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    return _dataset().to_table(columns=columns, filter=expression)
+
+def read_history(etfs=None, start=None, end=None, columns=None, where=None):
+    """scan() as a pandas DataFrame, with dates as datetime64."""
+    return scan(etfs, start, end, columns, where).to_pandas(date_as_object=False)
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["export"]:
+        database.init_db()
+        export_all(sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        print("Usage: python archive.py export [ETF]")
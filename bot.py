@@ -4,11 +4,13 @@ from discord.ext import commands
 import os
 import asyncio
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from config import ETFS
-from database import init_db, get_latest_date, get_holdings, save_holdings
-from scrapers import QQQIScraper, GPIQScraper, QYLDScraper, QDTEScraper
-from report import compare_holdings, analyze_options, generate_report, generate_options_only_report, generate_positions_only_report
+from browser import shutdown_browser_pool
+from database import init_db, get_latest_date, list_snapshots, get_holdings, get_holding_changes, get_holdings_window, save_holdings, close_db_connection
+from db_worker import get_db_worker, shutdown_db_worker
+from orchestrator import scrape_all
+from report import position_changes, holding_window, window_changes, analyze_options, OptionsAnalysis, generate_window_report
 import pandas as pd
 from dotenv import load_dotenv
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
@@ -36,14 +38,26 @@ intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix='!', intents=intents)
 scheduler = AsyncIOScheduler()
+# Every database call from a handler goes through this, keeping SQLite off the event loop
+db = get_db_worker()
 
-# Helper to get scraper instance
-def get_scraper(class_name):
-    if class_name == "QQQIScraper": return QQQIScraper()
-    if class_name == "GPIQScraper": return GPIQScraper()
-    if class_name == "QYLDScraper": return QYLDScraper()
-    if class_name == "QDTEScraper": return QDTEScraper()
-    return None
+def load_latest(ticker):
+    """(latest date, its holdings, its changes from the previous snapshot) for an ETF; run on the DB worker."""
+    latest_date = get_latest_date(ticker)
+    if not latest_date:
+        return None, None, None
+    return latest_date, get_holdings(latest_date, ticker), get_holding_changes(latest_date, ticker)
+
+# Report types covering every snapshot in a window ending at the latest one, in calendar days
+WINDOW_REPORTS = {"WEEK": 7, "MONTH": 31}
+
+def load_window(ticker, days):
+    """(snapshot dates, holdings history) for the `days` before an ETF's latest snapshot; run on the DB worker."""
+    latest_date = get_latest_date(ticker)
+    if not latest_date:
+        return [], None
+    start = (datetime.strptime(latest_date, '%Y-%m-%d') - timedelta(days=days)).strftime('%Y-%m-%d')
+    return get_holdings_window(ticker, start, latest_date)
 
 async def run_scheduled_task():
     """Function to run the daily scrape and report."""
@@ -67,22 +81,24 @@ async def run_scheduled_task():
     results = []
     target_tickers = list(ETFS.keys())
     
-    for t in target_tickers:
-        scraper = get_scraper(ETFS[t]["scraper_class"])
-        if not scraper: continue
-        
-        try:
-            df = await bot.loop.run_in_executor(None, scraper.fetch_holdings)
-            if not df.empty:
-                save_holdings(today, t, df)
-                results.append(f"✅ {t}: Success ({len(df)} records)")
-            else:
-                results.append(f"❌ {t}: Failed (Empty Data)")
-        except Exception as e:
-            results.append(f"⚠️ {t}: Error ({str(e)})")
+    scrape_results = await scrape_all(target_tickers, db_run=db.run)
+    for t, result in scrape_results.items():
+        if result.unchanged:
+            results.append(f"⏸️ {result.summary()}")
+        elif result.ok:
+            await db.run(save_holdings, today, t, result.df, payload_hash=result.payload_hash)
+            results.append(f"✅ {result.summary()}")
+        elif result.error:
+            results.append(f"⚠️ {result.summary()}")
+        else:
+            results.append(f"❌ {result.summary()}")
             
     await channel.send("Scrape Results:\n" + "\n".join(results))
 
+    if all(r.unchanged for r in scrape_results.values()):
+        await channel.send("✅ **No holdings changed since the last snapshot. Skipping reports.**")
+        return
+
     # 2. Report
     await channel.send("📊 Generating Daily Reports...")
     
@@ -90,33 +106,20 @@ async def run_scheduled_task():
     # Generate "ALL OPTIONS CHANGES" and "ALL CHANGES" equivalent
     
     all_current_holdings = []
+    all_options = []
     all_diffs_collection = {'new': [], 'sold': [], 'increased': [], 'decreased': []}
     
     from visualizer import TableVisualizer
     import io
-    import sqlite3
-    from config import DB_PATH
 
     for t in target_tickers:
-        latest_date = get_latest_date(t)
+        latest_date, df_current, diffs = await db.run(load_latest, t)
         if not latest_date: continue
             
-        df_current = get_holdings(latest_date, t)
         df_current['etf_ticker'] = t
-        
-        # Get Previous
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute(f"SELECT DISTINCT date FROM holdings_{t} ORDER BY date DESC LIMIT 2")
-        dates = [row[0] for row in c.fetchall()]
-        conn.close()
-        
-        df_prev = None
-        if len(dates) > 1:
-            df_prev = get_holdings(dates[1], t)
 
-        diffs = compare_holdings(df_current, df_prev)
         all_current_holdings.append(df_current)
+        all_options.append(analyze_options(df_current, as_of=latest_date))
         
         for key in diffs:
             if not diffs[key].empty:
@@ -127,7 +130,8 @@ async def run_scheduled_task():
     # Consolidated Options Report
     if all_current_holdings:
         combined_df = pd.concat(all_current_holdings, ignore_index=True)
-        img = await bot.loop.run_in_executor(None, lambda: TableVisualizer.generate_options_image(combined_df, title=f"All ETFs Options ({today})", date_str=today))
+        combined_options = OptionsAnalysis.concat(all_options)
+        img = await bot.loop.run_in_executor(None, lambda: TableVisualizer.generate_options_image(combined_df, title=f"All ETFs Options ({today})", date_str=today, analysis=combined_options))
         if img: await channel.send(file=discord.File(io.BytesIO(img), filename=f"all_options_{today}.png"))
 
     # Consolidated Changes Report
@@ -147,7 +151,7 @@ async def run_scheduled_task():
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user.name}')
-    init_db()
+    await db.run(init_db)
     print("Database initialized.")
     
     # Start Scheduler
@@ -184,13 +188,25 @@ async def latest_holdings(ctx, ticker: str):
         await ctx.send(f"Unknown ETF ticker: {ticker}. Available: {', '.join(ETFS.keys())}")
         return
 
-    latest_date = get_latest_date(ticker)
-    if not latest_date:
+    snapshots = await db.run(list_snapshots, ticker, limit=1)
+    if not snapshots:
         await ctx.send(f"No data found for {ticker}.")
         return
 
-    df = get_holdings(latest_date, ticker)
-    await ctx.send(f"**{ticker}**\nLatest Date: {latest_date}\nTotal Holdings: {len(df)}\n")
+    latest = snapshots[0]
+    await ctx.send(f"**{ticker}**\nLatest Date: {latest['date']}\nTotal Holdings: {latest['row_count']}\n")
+
+@bot.command(name='db_stats')
+async def db_stats(ctx):
+    """Show database worker queue depth and call latency."""
+    stats = db.stats()
+    lines = [f"**Database worker**\nPending: {stats['pending']} (peak {stats['high_water']}, limit {db.max_pending})"]
+    for name, m in sorted(stats['calls'].items()):
+        lines.append(
+            f"`{name}`: {m['calls']} calls, {m['errors']} errors, "
+            f"wait {m['avg_wait_ms']:.1f}ms, run {m['avg_run_ms']:.1f}ms, p95 {m['p95_ms']:.1f}ms, max {m['max_ms']:.1f}ms"
+        )
+    await ctx.send("\n".join(lines))
 
 @bot.command(name='report')
 async def report(ctx, ticker: str = "ALL", report_type: str = "ALL"):
@@ -202,15 +218,20 @@ async def report(ctx, ticker: str = "ALL", report_type: str = "ALL"):
       !report ALL OPTIONS
       !report ALL CHANGES
       !report ALL OPTIONS_CHANGES
+      !report QQQI WEEK
+      !report ALL MONTH
     """
     ticker = ticker.upper()
     report_type = report_type.upper()
     
     # Validate report_type
-    valid_types = ["ALL", "OPTIONS", "CHANGES", "OPTIONS_CHANGES", "POSITIONS"]
+    valid_types = ["ALL", "OPTIONS", "CHANGES", "OPTIONS_CHANGES", "POSITIONS"] + list(WINDOW_REPORTS)
     if report_type not in valid_types:
         await ctx.send(f"Invalid report type: {report_type}. Valid types: {', '.join(valid_types)}")
         return
+    if report_type in WINDOW_REPORTS:
+        await window_report(ctx, ticker, report_type)
+        return
 
     target_tickers = [ticker] if ticker != "ALL" else list(ETFS.keys())
     today = datetime.now().strftime('%Y-%m-%d')
@@ -219,43 +240,29 @@ async def report(ctx, ticker: str = "ALL", report_type: str = "ALL"):
     
     # Accumulators for consolidated reports
     all_current_holdings = []
+    all_options = []
     all_diffs_collection = {'new': [], 'sold': [], 'increased': [], 'decreased': []}
     
     from visualizer import TableVisualizer
     import io
     import pandas as pd
-    import sqlite3
-    from config import DB_PATH
 
     # 1. Collect Data & Generate Individual Reports
     for t in target_tickers:
         if t not in ETFS: continue
             
-        latest_date = get_latest_date(t)
+        # Current snapshot and its changes, diffed when it was saved
+        latest_date, df_current, diffs = await db.run(load_latest, t)
         if not latest_date:
             if ticker != "ALL": await ctx.send(f"No data found for {t}.")
             continue
             
-        # Get Current
-        df_current = get_holdings(latest_date, t)
         df_current['etf_ticker'] = t # Add ETF column
-        
-        # Get Previous
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute(f"SELECT DISTINCT date FROM holdings_{t} ORDER BY date DESC LIMIT 2")
-        dates = [row[0] for row in c.fetchall()]
-        conn.close()
-        
-        df_prev = None
-        if len(dates) > 1:
-            df_prev = get_holdings(dates[1], t)
+        options = analyze_options(df_current, as_of=latest_date)
 
-        # Process Changes
-        diffs = compare_holdings(df_current, df_prev)
-        
         # Collect for consolidated
         all_current_holdings.append(df_current)
+        all_options.append(options)
         for key in diffs:
             if not diffs[key].empty:
                 d = diffs[key].copy()
@@ -267,13 +274,7 @@ async def report(ctx, ticker: str = "ALL", report_type: str = "ALL"):
             # 1. Positions Report
             if report_type in ["ALL", "POSITIONS"]:
                 display_df = df_current.copy()
-                if df_prev is not None:
-                     merged = pd.merge(display_df, df_prev[['holding_ticker', 'shares']], on='holding_ticker', how='left', suffixes=('', '_prev'))
-                     merged['shares_prev'] = merged['shares_prev'].fillna(0)
-                     merged['shares_change'] = merged['shares'] - merged['shares_prev']
-                     display_df = merged
-                else:
-                     display_df['shares_change'] = 0
+                display_df['shares_change'] = position_changes(df_current, diffs)
                 
                 # Run visualizer in executor
                 img = await bot.loop.run_in_executor(None, lambda: TableVisualizer.generate_image(display_df, title=f"{t} Holdings ({latest_date})", date_str=latest_date))
@@ -281,7 +282,7 @@ async def report(ctx, ticker: str = "ALL", report_type: str = "ALL"):
 
             # 2. Options Report
             if report_type in ["ALL", "OPTIONS"]:
-                img = await bot.loop.run_in_executor(None, lambda: TableVisualizer.generate_options_image(df_current, title=f"{t} Options ({latest_date})", date_str=latest_date))
+                img = await bot.loop.run_in_executor(None, lambda: TableVisualizer.generate_options_image(df_current, title=f"{t} Options ({latest_date})", date_str=latest_date, analysis=options))
                 if img: await ctx.send(file=discord.File(io.BytesIO(img), filename=f"{t}_options.png"))
 
             # 3. Changes Report
@@ -314,7 +315,8 @@ async def report(ctx, ticker: str = "ALL", report_type: str = "ALL"):
         # Consolidated Options
         if report_type in ["ALL", "OPTIONS"]:
             combined_df = pd.concat(all_current_holdings, ignore_index=True)
-            img = await bot.loop.run_in_executor(None, lambda: TableVisualizer.generate_options_image(combined_df, title=f"All ETFs Options ({today})", date_str=today))
+            combined_options = OptionsAnalysis.concat(all_options)
+            img = await bot.loop.run_in_executor(None, lambda: TableVisualizer.generate_options_image(combined_df, title=f"All ETFs Options ({today})", date_str=today, analysis=combined_options))
             if img: await ctx.send(file=discord.File(io.BytesIO(img), filename="all_options.png"))
 
         # Consolidated Changes
@@ -348,6 +350,45 @@ async def report(ctx, ticker: str = "ALL", report_type: str = "ALL"):
             else:
                  await ctx.send("No option changes detected across all ETFs.")
 
+async def window_report(ctx, ticker, report_type):
+    """Changes from the first to the last snapshot of the window, with how long each leg was held."""
+    target_tickers = [ticker] if ticker != "ALL" else list(ETFS.keys())
+    await ctx.send(f"Generating {report_type} report for {ticker}...")
+
+    from visualizer import TableVisualizer
+    import io
+
+    all_diffs_collection = {'new': [], 'sold': [], 'increased': [], 'decreased': []}
+    first_date = last_date = None
+    for t in target_tickers:
+        if t not in ETFS: continue
+        dates, history = await db.run(load_window, t, WINDOW_REPORTS[report_type])
+        if len(dates) < 2:
+            if ticker != "ALL": await ctx.send(f"Not enough snapshots for {t}.")
+            continue
+
+        summary = holding_window(history, dates)
+        diffs = window_changes(summary)
+        await ctx.send(generate_window_report(t, dates, summary)[:2000])
+        first_date = min(first_date or dates[0], dates[0])
+        last_date = max(last_date or dates[-1], dates[-1])
+        for key in all_diffs_collection:
+            if not diffs[key].empty:
+                all_diffs_collection[key].append(diffs[key].assign(etf_ticker=t))
+
+    if last_date is None:
+        if ticker == "ALL": await ctx.send("No data available for consolidated reports.")
+        return
+
+    combined_diffs = {
+        key: pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        for key, frames in all_diffs_collection.items()
+    }
+    name = ticker if ticker != "ALL" else "All ETFs"
+    title = f"{name} {report_type.title()} Changes ({first_date} to {last_date})"
+    img = await bot.loop.run_in_executor(None, lambda: TableVisualizer.generate_changes_image(combined_diffs, title=title, date_str=last_date))
+    if img: await ctx.send(file=discord.File(io.BytesIO(img), filename=f"{ticker.lower()}_{report_type.lower()}_changes.png"))
+
 @bot.command(name='scrape')
 async def scrape(ctx, ticker: str = "ALL"):
     """
@@ -362,27 +403,15 @@ async def scrape(ctx, ticker: str = "ALL"):
     today = datetime.now().strftime('%Y-%m-%d')
     results = []
     
-    for t in target_tickers:
-        if t not in ETFS: 
-            results.append(f"{t}: Invalid Ticker")
-            continue
-            
-        scraper = get_scraper(ETFS[t]["scraper_class"])
-        if not scraper:
-            results.append(f"{t}: No scraper defined")
-            continue
-            
-        try:
-            # Run blocking code in executor to avoid freezing bot
-            df = await bot.loop.run_in_executor(None, scraper.fetch_holdings)
-            
-            if not df.empty:
-                save_holdings(today, t, df)
-                results.append(f"{t}: Success ({len(df)} records)")
-            else:
-                results.append(f"{t}: Failed (Empty Data)")
-        except Exception as e:
-            results.append(f"{t}: Error ({str(e)})")
+    invalid = [t for t in target_tickers if t not in ETFS]
+    results.extend(f"{t}: Invalid Ticker" for t in invalid)
+    
+    # Scrapers run concurrently off the event loop
+    scrape_results = await scrape_all([t for t in target_tickers if t not in invalid], db_run=db.run)
+    for t, result in scrape_results.items():
+        if result.ok:
+            await db.run(save_holdings, today, t, result.df, payload_hash=result.payload_hash)
+        results.append(result.summary())
             
     await ctx.send("Scrape complete:\n" + "\n".join(results))
 
@@ -392,4 +421,9 @@ if __name__ == "__main__":
     if not TOKEN:
         print("Error: DISCORD_TOKEN environment variable not set.")
         sys.exit(1)
-    bot.run(TOKEN)
+    try:
+        bot.run(TOKEN)
+    finally:
+        shutdown_browser_pool()
+        shutdown_db_worker()
+        close_db_connection()
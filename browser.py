@@ -0,0 +1,271 @@
+import asyncio
+import atexit
+import concurrent.futures
+import threading
+import time
+from contextlib import contextmanager
+from playwright.async_api import async_playwright, Error as PlaywrightError
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from config import BROWSER_POOL_SIZE, BROWSER_HEADLESS, BROWSER_HEALTH_CHECK_INTERVAL, BROWSER_HEALTH_CHECK_TIMEOUT
+from endpoint_cache import replay_headers
+
+class BrowserPool:
+    """
+    Process-wide headless Chromium shared by the scrapers and the visualizer.
+
+    Chromium is launched once, on a dedicated thread that runs its own event loop,
+    so it can be used from the main thread, executor threads or the bot loop alike.
+    Every task gets its own isolated browser context and page, at most `size` at a time.
+    If Chromium dies it is relaunched on the next task; one idle for longer than
+    BROWSER_HEALTH_CHECK_INTERVAL is probed first and relaunched if it has hung.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, headless=BROWSER_HEADLESS):
+        self.size = size
+        self.headless = headless
+        self.launches = 0
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._playwright = None
+        self._browser = None
+        self._slots = None
+        self._launch_lock = None
+
+    def _start(self):
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def runner():
+                asyncio.set_event_loop(loop)
+                ready.set()
+                loop.run_forever()
+
+            thread = threading.Thread(target=runner, name="browser-pool", daemon=True)
+            thread.start()
+            ready.wait()
+
+            self._slots = asyncio.Semaphore(self.size)
+            self._launch_lock = asyncio.Lock()
+            self._loop, self._thread = loop, thread
+            return loop
+
+    async def _ensure_browser(self):
+        async with self._launch_lock:
+            browser = self._browser
+            if browser is not None and browser.is_connected():
+                # A connected Chromium can still be hung; probe it after a quiet spell
+                idle = time.monotonic() - self._last_used
+                if idle < BROWSER_HEALTH_CHECK_INTERVAL or await self._responsive(browser):
+                    self._last_used = time.monotonic()
+                    return browser
+                print("Shared Chromium is not responding. Relaunching...")
+                await self._close_browser()
+            elif browser is not None:
+                print("Shared Chromium disconnected. Relaunching...")
+                await self._close_browser()
+
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=self.headless)
+            self.launches += 1
+            self._last_used = time.monotonic()
+            print(f"Launched shared Chromium (launch #{self.launches}).")
+            return self._browser
+
+    async def _responsive(self, browser):
+        """True if the browser can open a page and evaluate JS within BROWSER_HEALTH_CHECK_TIMEOUT."""
+        async def probe():
+            context = await browser.new_context()
+            try:
+                page = await context.new_page()
+                return await page.evaluate("1 + 1") == 2
+            finally:
+                await context.close()
+
+        try:
+            return await asyncio.wait_for(probe(), BROWSER_HEALTH_CHECK_TIMEOUT)
+        except (PlaywrightError, asyncio.TimeoutError) as e:
+            print(f"Browser health check failed: {e!r}")
+            return False
+
+    async def _close_browser(self):
+        browser, self._browser = self._browser, None
+        if browser is not None:
+            try:
+                # A hung browser may never acknowledge the close
+                await asyncio.wait_for(browser.close(), BROWSER_HEALTH_CHECK_TIMEOUT)
+            except (PlaywrightError, asyncio.TimeoutError):
+                pass
+
+    async def _close_all(self):
+        await self._close_browser()
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            finally:
+                self._playwright = None
+
+    async def _run(self, fn, args, context_options, retries=1):
+        async with self._slots:
+            for attempt in range(retries + 1):
+                browser = await self._ensure_browser()
+                context = None
+                try:
+                    context = await browser.new_context(**context_options)
+                    page = await context.new_page()
+                    return await fn(page, *args)
+                except PlaywrightError:
+                    # Only a crashed browser is worth retrying; page-level errors go to the caller
+                    if browser.is_connected() or attempt == retries:
+                        raise
+                    print("Shared Chromium crashed mid-task. Retrying on a fresh browser...")
+                finally:
+                    if context is not None:
+                        try:
+                            await context.close()
+                        except PlaywrightError:
+                            pass
+
+    def run(self, fn, *args, timeout=None, **context_options):
+        """
+        Run `await fn(page, *args)` on a pooled page and return its result.
+        Blocks the calling thread. Keyword arguments are passed to `browser.new_context`.
+        """
+        loop = self._start()
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("BrowserPool.run() cannot be called from the browser thread.")
+
+        future = asyncio.run_coroutine_threadsafe(self._run(fn, args, context_options), loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # Not the builtin TimeoutError before Python 3.11
+            future.cancel()
+            raise
+
+    async def run_async(self, fn, *args, timeout=None, **context_options):
+        """
+        Awaitable version of run() for callers on their own event loop (e.g. the bot).
+        The page still lives on the browser thread; the caller's loop just awaits the result.
+        """
+        loop = self._start()
+        if asyncio.get_running_loop() is loop:
+            return await asyncio.wait_for(self._run(fn, args, context_options), timeout)
+
+        future = asyncio.run_coroutine_threadsafe(self._run(fn, args, context_options), loop)
+        # Cancelling the wrapper (e.g. on timeout) cancels the task on the browser loop too
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    def shutdown(self, timeout=10):
+        """Close Chromium and stop the browser thread. Safe to call more than once."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None:
+                return
+            self._loop = self._thread = None
+
+        future = asyncio.run_coroutine_threadsafe(self._close_all(), loop)
+        try:
+            future.result(timeout)
+        except Exception as e:
+            print(f"Error shutting down browser pool: {e}")
+
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
+        print("Shared Chromium shut down.")
+
+
+class PhaseTimer:
+    """Records how long each named phase of a browser task took, in seconds."""
+
+    def __init__(self, label):
+        self.label = label
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    def summary(self):
+        parts = ", ".join(f"{name} {secs:.2f}s" for name, secs in self.phases.items())
+        return f"{self.label} timings: {parts} (total {self.total:.2f}s)"
+
+
+async def wait_for(locator, state="visible", timeout=10000):
+    """Wait for a locator to reach `state`; return False instead of raising on timeout."""
+    try:
+        await locator.wait_for(state=state, timeout=timeout)
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+
+class RequestRecorder:
+    """Remembers the requests a page makes so the one behind a download can be replayed over plain HTTP."""
+
+    def __init__(self, page):
+        self._requests = {}
+        page.on("request", self._on_request)
+
+    def _on_request(self, request):
+        self._requests[request.url] = request
+
+    async def endpoint_for(self, download):
+        """Return (url, headers) for the GET behind a download, or None if it cannot be replayed."""
+        url = download.url
+        if not url.startswith(('http://', 'https://')):
+            # blob:/data: downloads are generated in the page and have no endpoint
+            return None
+
+        request = self._requests.get(url)
+        if request is None:
+            return url, {}
+        if request.method != 'GET':
+            return None
+
+        return url, replay_headers(await request.all_headers())
+
+
+async def read_download(download):
+    """
+    Read a finished download into memory.
+    Playwright stores it in its own per-download temp file, deleted when the context closes,
+    so concurrent scrapes never share a path.
+    """
+    path = await download.path()
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_browser_pool():
+    """Return the process-wide BrowserPool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+def shutdown_browser_pool():
+    """Shut down the shared browser if it was ever started."""
+    if _pool is not None:
+        _pool.shutdown()
@@ -6,17 +6,60 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Database
 DB_NAME = "etf_data.db"
 DB_PATH = os.path.join(BASE_DIR, DB_NAME)
+DB_BUSY_TIMEOUT = 10  # seconds a writer waits for a lock before failing
+DB_CACHE_SIZE_MB = 64  # page cache per connection
+DB_MMAP_SIZE_MB = 256  # memory-mapped I/O per connection
+DB_WORKER_QUEUE_SIZE = 64  # database calls the bot may have queued at once (see db_worker.py)
+SNAPSHOT_CACHE_MB = 128  # decoded snapshots kept in memory by get_holdings; 0 disables the cache
+# "delta": store a full base snapshot, then only each day's added/changed/removed rows.
+# "full": store every day in full.
+HOLDINGS_STORAGE = os.getenv("HOLDINGS_STORAGE", "delta")
+SNAPSHOT_BASE_INTERVAL = 20  # snapshots per base in delta mode
+# Parquet copy of the history for backtests (see archive.py), updated on every save_holdings
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(BASE_DIR, "archive"))
+ARCHIVE_HOLDINGS = os.getenv("ARCHIVE_HOLDINGS", "1") == "1"
 
 # User Agent
 USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36"
 
-# URLs
-QQQI_AJAX_URL = "https://neosfunds.com/wp-admin/admin-ajax.php"
-GPIQ_HOLDINGS_URL = "https://am.gs.com/en-us/individual/funds/detail/PV105259/38149W630/goldman-sachs-nasdaq-100-premium-income-etf"
+# Shared headless Chromium (see browser.py)
+BROWSER_POOL_SIZE = 4
+BROWSER_HEADLESS = True
+# A browser idle this long (seconds) is probed before its next task, and relaunched if
+# it cannot open a page within BROWSER_HEALTH_CHECK_TIMEOUT
+BROWSER_HEALTH_CHECK_INTERVAL = 300
+BROWSER_HEALTH_CHECK_TIMEOUT = 30
+
+# HTTP client for the non-browser scrapers
+HTTP_TIMEOUT = (10, 60)  # (connect, read) seconds
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5  # seconds, doubled on each retry
+HTTP_POOL_SIZE = 10
+# ETag/Last-Modified of each URL's last download, kept across runs for conditional GETs
+HTTP_VALIDATORS_PATH = os.getenv("HTTP_VALIDATORS_PATH", os.path.join(BASE_DIR, "http_validators.json"))
+HTTP_VALIDATORS_MAX = 256  # URLs remembered; the oldest are dropped (e.g. past dated QYLD files)
+
+# Download endpoints discovered by the browser scrapers (see endpoint_cache.py)
+ENDPOINT_CACHE_PATH = os.getenv("ENDPOINT_CACHE_PATH", os.path.join(BASE_DIR, "endpoint_cache.json"))
+ENDPOINT_CACHE_TTL = 7 * 24 * 3600  # seconds
+
+# Scrape orchestration (see orchestrator.py)
+SCRAPE_MAX_CONCURRENCY = 4
+SCRAPE_TIMEOUT = 180  # seconds per scraper
+
+# URLs (each can be overridden from the environment, e.g. to point at replay.py)
+QQQI_AJAX_URL = os.getenv("QQQI_AJAX_URL", "https://neosfunds.com/wp-admin/admin-ajax.php")
+GPIQ_HOLDINGS_URL = os.getenv("GPIQ_HOLDINGS_URL", "https://am.gs.com/en-us/individual/funds/detail/PV105259/38149W630/goldman-sachs-nasdaq-100-premium-income-etf")
 
 # New ETFs
-QYLD_HOLDINGS_URL_BASE = "https://assets.globalxetfs.com/funds/holdings/qyld_full-holdings_{date}.csv"
-QDTE_HOLDINGS_URL = "https://www.roundhillinvestments.com/etf/qdte"
+QYLD_HOLDINGS_URL_BASE = os.getenv("QYLD_HOLDINGS_URL_BASE", "https://assets.globalxetfs.com/funds/holdings/qyld_full-holdings_{date}.csv")
+# Seconds before a 404 on today's QYLD file is retried; until then polls go straight to yesterday's
+QYLD_MISSING_RETRY = 3600
+QDTE_HOLDINGS_URL = os.getenv("QDTE_HOLDINGS_URL", "https://www.roundhillinvestments.com/etf/qdte")
+
+# Offline fixtures (see replay.py). Set FIXTURE_RECORD_DIR to save every raw payload scraped.
+FIXTURES_DIR = os.path.join(BASE_DIR, "fixtures")
+FIXTURE_RECORD_DIR = os.getenv("FIXTURE_RECORD_DIR")
 
 # ETF Configs
 ETFS = {
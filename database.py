@@ -1,98 +1,1118 @@
 import sqlite3
+import sys
+import threading
+import numpy as np
 import pandas as pd
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import repeat
 from datetime import datetime
 import os
-from config import DB_PATH
+from config import DB_PATH, DB_BUSY_TIMEOUT, DB_CACHE_SIZE_MB, DB_MMAP_SIZE_MB
+from config import HOLDINGS_STORAGE, SNAPSHOT_BASE_INTERVAL, ARCHIVE_HOLDINGS, SNAPSHOT_CACHE_MB
 from config import ETFS
+from report import instrument_keys
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+# One connection per thread (sqlite3 connections must not be shared across threads),
+# opened on first use and reused for every later call on that thread.
+_local = threading.local()
+
+def _open_connection(path):
+    # isolation_level=None: no implicit transactions; writes go through transaction()
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT, isolation_level=None)
     conn.row_factory = sqlite3.Row
+    # WAL lets readers (the bot's commands) run while the scheduled scrape is writing
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Safe with WAL: a crash can lose the last commit but never corrupts the database
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_MB * 1024}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE_MB * 1024 * 1024}")
+    conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def get_db_connection():
+    """Return this thread's connection to DB_PATH, opening and tuning it on first use."""
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(DB_PATH)
+    if conn is None:
+        conn = connections[DB_PATH] = _open_connection(DB_PATH)
     return conn
 
+def close_db_connection():
+    """Close this thread's connections (e.g. before the process or a worker thread exits)."""
+    for conn in getattr(_local, 'connections', {}).values():
+        conn.close()
+    _local.connections = {}
+
+@contextmanager
+def db_connection():
+    """
+    Borrow this thread's connection for reads:
+
+        with db_connection() as conn:
+            conn.execute("SELECT ...")
+    """
+    yield get_db_connection()
+
+@contextmanager
+def transaction():
+    """
+    Run a block of writes in one explicit transaction (BEGIN IMMEDIATE, so the write
+    lock is taken up front instead of failing halfway). Commits on success and rolls
+    back on any exception. Nested uses join the outermost transaction.
+    """
+    conn = get_db_connection()
+    depth = getattr(_local, 'tx_depth', 0)
+    if depth:
+        _local.tx_depth = depth + 1
+        try:
+            yield conn
+        finally:
+            _local.tx_depth = depth
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    _local.tx_depth = 1
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+    finally:
+        _local.tx_depth = 0
+
+class SnapshotCache:
+    """
+    LRU cache of decoded get_holdings frames keyed by (database, etf, date), bounded by
+    their in-memory size. Frames go in and out as deep copies, so a caller modifying the
+    frame it got (e.g. df.loc[...] = ..., or inplace=True) never touches the cached one,
+    whether or not pandas' copy-on-write is enabled (it is not before pandas 3). Copying
+    50k rows takes milliseconds; decoding them again takes about half a second.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        # Bumped by every invalidation, so a read that raced a save is not cached
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0].copy(deep=True)
+
+    def put(self, key, df, generation):
+        """Cache df, unless something was invalidated since `generation` was read."""
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._discard(key)
+            self._entries[key] = (df.copy(deep=True), size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def invalidate(self, etf_ticker=None, from_date=None):
+        """Drop the cached dates of an ETF from `from_date` on ('YYYY-MM-DD'; default all)."""
+        with self._lock:
+            self.generation += 1
+            for key in list(self._entries):
+                path, etf, date = key
+                if (etf_ticker is None or etf == etf_ticker) and (from_date is None or date >= from_date):
+                    self._discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._entries), 'bytes': self.bytes,
+            }
+
+_snapshot_cache = SnapshotCache(SNAPSHOT_CACHE_MB * 1024 * 1024)
+
+def snapshot_cache_stats():
+    """Hit/miss/eviction counters and current size of the get_holdings cache."""
+    return _snapshot_cache.stats()
+
+def clear_snapshot_cache():
+    _snapshot_cache.invalidate()
+
+# Columns of a holding as returned by get_holdings (after id, date and security_id)
+HOLDING_COLUMNS = [
+    'holding_ticker', 'description', 'shares', 'market_value',
+    'weight', 'asset_class', 'strike_price', 'expiration_date', 'option_type'
+]
+# What the security master stores per instrument. Its identity is the canonical key of
+# report.INSTRUMENT_KEY_COLUMNS (the one compare_holdings matches on): a new description
+# or asset class is the same instrument, and the master keeps the latest seen.
+SECURITY_COLUMNS = ['holding_ticker', 'description', 'asset_class', 'option_type', 'expiration_date', 'strike_price']
+# What a holdings row stores for it on a given day
+POSITION_COLUMNS = ['shares', 'market_value', 'weight']
+# What a position time series can track (see get_position_pivot)
+POSITION_VALUES = POSITION_COLUMNS + ['strike_price', 'expiration_date']
+# Closest two sort keys of a delta snapshot may get before it is stored as a base instead
+MIN_POSITION_GAP = 1e-6
+# Per-snapshot figures kept in the snapshots catalog
+CATALOG_COLUMNS = {
+    'row_count': 'INTEGER', 'market_value': 'REAL', 'option_count': 'INTEGER',
+    'payload_hash': 'TEXT', 'ingested_at': 'TEXT'
+}
+# The kinds of change materialized in holding_changes (compare_holdings keys, less 'unchanged')
+CHANGE_KINDS = ['new', 'sold', 'increased', 'decreased']
+
+def date_to_int(date):
+    """'2025-12-01' -> 20251201, the sortable form dates are stored in."""
+    return int(date.replace('-', ''))
+
+def int_to_date(value):
+    """20251201 -> '2025-12-01'."""
+    value = str(value)
+    return f"{value[:4]}-{value[4:6]}-{value[6:]}"
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Create separate tables for each ETF
-    for ticker in ETFS.keys():
-        table_name = f"holdings_{ticker}"
-        c.execute(f'''CREATE TABLE IF NOT EXISTS {table_name} (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT,
-            holding_ticker TEXT,
-            description TEXT,
-            shares REAL,
-            market_value REAL,
-            weight REAL,
-            asset_class TEXT,
-            strike_price REAL,
-            expiration_date TEXT,
-            option_type TEXT
-        )''')
-        
-    conn.commit()
-    conn.close()
-
-def save_holdings(date, etf_ticker, df):
-    conn = sqlite3.connect(DB_PATH)
-    table_name = f"holdings_{etf_ticker}"
-    
-    # Check if data for this date already exists to avoid duplicates
-    # We delete old data for the same date and re-insert
+    # Migrations below may renumber rows and securities
+    clear_snapshot_cache()
+    with transaction() as conn:
+        _create_schema(conn)
+    _migrate_security_keys()
+    _migrate_text_holdings()
+    migrate_legacy_tables()
+    _migrate_payload_hashes()
+    _backfill_catalog()
+    _backfill_changes()
+
+def _create_schema(conn):
     c = conn.cursor()
-    c.execute(f"DELETE FROM {table_name} WHERE date = ?", (date,))
-    
-    # Prepare dataframe for insertion
-    # Ensure columns match schema
-    # Schema: date, holding_ticker, description, shares, market_value, weight, asset_class, strike_price, expiration_date, option_type
-    
-    # Add date column if not present or ensure it matches
-    df['date'] = date
-    
-    # Select and order columns
-    cols_to_keep = [
-        'date', 'holding_ticker', 'description', 'shares', 'market_value', 
-        'weight', 'asset_class', 'strike_price', 'expiration_date', 'option_type'
-    ]
-    
+
+    # Holdings tables from before the security master kept the instrument as text on
+    # every row; set them aside for _migrate_text_holdings
+    existing = {row[1] for row in c.execute("PRAGMA table_info(holdings)")}
+    if 'holding_ticker' in existing:
+        c.execute("ALTER TABLE holdings RENAME TO text_holdings")
+        for name in ("idx_holdings_etf_date_key", "idx_holdings_etf_date", "idx_holdings_etf_ticker_date"):
+            c.execute(f"DROP INDEX IF EXISTS {name}")
+
+    # Security master: each distinct instrument (equity, cash line or option contract) once.
+    # security_key is report.instrument_keys() of the instrument.
+    c.execute('''CREATE TABLE IF NOT EXISTS securities (
+        id INTEGER PRIMARY KEY,
+        security_key TEXT NOT NULL UNIQUE,
+        holding_ticker TEXT,
+        description TEXT,
+        asset_class TEXT,
+        option_type TEXT,
+        expiration_date TEXT,
+        strike_price REAL
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_securities_ticker ON securities (holding_ticker)")
+
+    # One table for every ETF; dates are YYYYMMDD integers so they sort and range-scan cheaply.
+    # A row is (security_id, lot): lot numbers repeats of the same instrument in one file.
+    c.execute('''CREATE TABLE IF NOT EXISTS holdings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        etf TEXT NOT NULL,
+        date INTEGER NOT NULL,
+        security_id INTEGER NOT NULL REFERENCES securities (id),
+        lot INTEGER NOT NULL DEFAULT 0,
+        position INTEGER,
+        removed INTEGER NOT NULL DEFAULT 0,
+        shares REAL,
+        market_value REAL,
+        weight REAL
+    )''')
+    # One row per instrument per snapshot; save_holdings upserts against this. Also serves
+    # (etf, date) lookups. `position` sorts the rows in issuer-file order (a base stores
+    # 0..n-1, a delta may store fractional keys; see _sort_keys); `removed` marks a delta
+    # tombstone (the instrument left the fund on this date).
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_holdings_etf_date_security ON holdings (etf, date, security_id, lot)")
+    # Per-instrument history
+    c.execute("CREATE INDEX IF NOT EXISTS idx_holdings_etf_security_date ON holdings (etf, security_id, date)")
+
+    # Snapshot catalog: every stored (etf, date) and the base snapshot its holdings rows are
+    # relative to (a base is stored in full; later dates in its chain only store what changed),
+    # plus summary figures so listing snapshots never touches holdings. payload_hash is the
+    # hash of the raw issuer file, used to skip unchanged re-downloads.
+    c.execute('''CREATE TABLE IF NOT EXISTS snapshots (
+        etf TEXT NOT NULL,
+        date INTEGER NOT NULL,
+        base_date INTEGER NOT NULL,
+        row_count INTEGER,
+        market_value REAL,
+        option_count INTEGER,
+        payload_hash TEXT,
+        ingested_at TEXT,
+        changes_from INTEGER,
+        PRIMARY KEY (etf, date)
+    )''')
+    existing = {row[1] for row in c.execute("PRAGMA table_info(snapshots)")}
+    for col, col_type in {**CATALOG_COLUMNS, 'changes_from': 'INTEGER'}.items():
+        if col not in existing:
+            c.execute(f"ALTER TABLE snapshots ADD COLUMN {col} {col_type}")
+
+    # compare_holdings() of each snapshot against the previous stored date, computed at
+    # ingest so a changes report is one range read of the primary key. One row per changed
+    # holding (unchanged ones are not stored); `position` is its row in today's file, or in
+    # yesterday's for 'sold'. snapshots.changes_from is the date diffed against (0 for an
+    # ETF's first snapshot, NULL until computed).
+    c.execute('''CREATE TABLE IF NOT EXISTS holding_changes (
+        etf TEXT NOT NULL,
+        date INTEGER NOT NULL,
+        change TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        security_id INTEGER NOT NULL REFERENCES securities (id),
+        shares_today REAL,
+        shares_yesterday REAL,
+        market_value_today REAL,
+        market_value_yesterday REAL,
+        weight_today REAL,
+        weight_yesterday REAL,
+        PRIMARY KEY (etf, date, change, position)
+    ) WITHOUT ROWID''')
+
+def _migrate_security_keys():
+    """
+    Re-key securities stored under the old identity (every SECURITY_COLUMNS, so an edited
+    description was a new instrument) with instrument_keys(). Rows that now share a key
+    merge into the lowest id: the ETFs holding the others are re-encoded onto it and their
+    holding_changes recomputed.
+    """
+    conn = get_db_connection()
+    # Old keys have a field per SECURITY_COLUMNS; instrument_keys() has fewer
+    old_key = '%' + '\x1f%' * (len(SECURITY_COLUMNS) - 1)
+    if conn.execute("SELECT 1 FROM securities WHERE security_key LIKE ? LIMIT 1", (old_key,)).fetchone() is None:
+        return
+
+    securities = pd.read_sql_query(f"SELECT id, {', '.join(SECURITY_COLUMNS)} FROM securities ORDER BY id", conn)
+    keys = instrument_keys(securities)
+    survivors = securities['id'].groupby(keys).transform('min') == securities['id']
+    merged = [int(i) for i in securities.loc[~survivors, 'id']]
+    with transaction():
+        # New keys cannot clash with old ones, so merged rows keep theirs while they are read
+        conn.executemany(
+            "UPDATE securities SET security_key = ? WHERE id = ?",
+            zip(keys[survivors], securities.loc[survivors, 'id'].astype(int))
+        )
+        if merged:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS merged_securities (id INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM merged_securities")
+            conn.executemany("INSERT INTO merged_securities (id) VALUES (?)", ((i,) for i in merged))
+            tickers = [r[0] for r in conn.execute(
+                "SELECT DISTINCT etf FROM holdings WHERE security_id IN (SELECT id FROM merged_securities) "
+                "UNION SELECT DISTINCT etf FROM holding_changes WHERE security_id IN (SELECT id FROM merged_securities)"
+            )]
+            for ticker in tickers:
+                def restore(day, ticker=ticker):
+                    frame = _read_snapshot(conn, ticker, day, with_securities=True).reset_index(drop=True)
+                    return _snapshot_frame(conn, frame)
+                for day in _reencode(conn, ticker, restore):
+                    _write_changes(conn, ticker, day)
+            conn.execute("DELETE FROM securities WHERE id IN (SELECT id FROM merged_securities)")
+    print(f"Re-keyed {len(securities)} securities ({len(merged)} merged into instruments already stored)")
+
+def _migrate_text_holdings():
+    """
+    Re-store every snapshot of a pre-security-master holdings table (set aside as
+    text_holdings by _create_schema) in the current layout, oldest first, then drop it.
+    Handles both full-copy tables and the earlier delta encoding keyed by instrument_key.
+    """
+    conn = get_db_connection()
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'text_holdings'").fetchone() is None:
+        return
+
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(text_holdings)")}
+    cols = ", ".join(f"h.{col}" for col in HOLDING_COLUMNS)
+    with transaction():
+        if 'removed' in existing:
+            snaps = conn.execute("SELECT etf, date, base_date FROM snapshots ORDER BY etf, date").fetchall()
+            query = (
+                f"SELECT {cols} FROM text_holdings h "
+                "JOIN (SELECT instrument_key, MAX(date) AS date FROM text_holdings "
+                "      WHERE etf = ? AND date BETWEEN ? AND ? GROUP BY instrument_key) latest "
+                "  ON h.instrument_key = latest.instrument_key AND h.date = latest.date "
+                "WHERE h.etf = ? AND h.removed = 0 ORDER BY h.position, h.id"
+            )
+            read = lambda etf, day, base: pd.read_sql_query(query, conn, params=(etf, base, day, etf))
+        else:
+            # Every date was stored in full
+            snaps = conn.execute("SELECT DISTINCT etf, date, date FROM text_holdings ORDER BY etf, date").fetchall()
+            query = f"SELECT {cols} FROM text_holdings h WHERE etf = ? AND date = ? ORDER BY id"
+            read = lambda etf, day, base: pd.read_sql_query(query, conn, params=(etf, day))
+
+        frames = ((etf, day, read(etf, day, base)) for etf, day, base in snaps)
+        conn.execute("DELETE FROM snapshots")
+        for etf, day, df in frames:
+            _write_snapshot(conn, etf, day, _snapshot_frame(conn, df))
+        conn.execute("DROP TABLE text_holdings")
+    print(f"Moved {len(snaps)} snapshots onto the security master")
+
+def migrate_legacy_tables():
+    """
+    Move the snapshots in the old per-ETF holdings_{ticker} tables into the holdings
+    table and drop them. Each table is moved in its own transaction, so an interrupted
+    migration simply resumes with the remaining tables on the next init_db().
+    """
+    conn = get_db_connection()
+    c = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'holdings\\_%' ESCAPE '\\'")
+    legacy_tables = [row[0] for row in c.fetchall()]
+
+    cols = ", ".join(HOLDING_COLUMNS)
+    for table_name in legacy_tables:
+        etf_ticker = table_name[len("holdings_"):]
+        with transaction():
+            dates = [r[0] for r in conn.execute(f"SELECT DISTINCT date FROM {table_name} WHERE date IS NOT NULL ORDER BY date")]
+            for date in dates:
+                df = pd.read_sql_query(f"SELECT {cols} FROM {table_name} WHERE date = ? ORDER BY id", conn, params=(date,))
+                _write_snapshot(conn, etf_ticker, date_to_int(date), _snapshot_frame(conn, df))
+            conn.execute(f"DROP TABLE {table_name}")
+        print(f"Migrated {len(dates)} snapshots from {table_name} into holdings")
+
+def _migrate_payload_hashes():
+    """Fold the old payload_hashes table into the snapshots catalog."""
+    conn = get_db_connection()
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'payload_hashes'").fetchone() is None:
+        return
+    with transaction():
+        conn.execute(
+            "UPDATE snapshots SET payload_hash = p.payload_hash, ingested_at = p.ingested_at "
+            "FROM payload_hashes p "
+            "WHERE p.etf = snapshots.etf AND CAST(REPLACE(p.date, '-', '') AS INTEGER) = snapshots.date"
+        )
+        conn.execute("DROP TABLE payload_hashes")
+
+def _snapshot_stats(df):
+    """Catalog figures of a snapshot frame with HOLDING_COLUMNS."""
+    return {
+        'row_count': len(df),
+        'market_value': float(pd.to_numeric(df['market_value'], errors='coerce').sum()),
+        'option_count': int((df['asset_class'] == 'Option').sum()),
+    }
+
+def _backfill_catalog():
+    """Fill in catalog figures for snapshots stored before the catalog had them."""
+    conn = get_db_connection()
+    missing = conn.execute("SELECT etf, date FROM snapshots WHERE row_count IS NULL ORDER BY etf, date").fetchall()
+    if not missing:
+        return
+    with transaction():
+        for etf, day in missing:
+            stats = _snapshot_stats(_read_snapshot(conn, etf, day, with_securities=True))
+            conn.execute(
+                "UPDATE snapshots SET row_count = ?, market_value = ?, option_count = ? WHERE etf = ? AND date = ?",
+                (stats['row_count'], stats['market_value'], stats['option_count'], etf, day)
+            )
+    print(f"Catalogued {len(missing)} snapshots")
+
+def _backfill_changes():
+    """Materialize holding_changes for snapshots stored before the table existed."""
+    conn = get_db_connection()
+    missing = conn.execute("SELECT etf, date FROM snapshots WHERE changes_from IS NULL ORDER BY etf, date").fetchall()
+    if not missing:
+        return
+    with transaction():
+        for etf, day in missing:
+            _write_changes(conn, etf, day)
+    print(f"Computed changes for {len(missing)} snapshots")
+
+def intern_securities(conn, securities):
+    """
+    Return the securities.id of each row of `securities` (a frame of SECURITY_COLUMNS with
+    None for missing values), adding instruments seen for the first time and taking the
+    description and asset class of known ones from their first row here.
+    """
+    codes, keys = pd.factorize(instrument_keys(securities))
+    first = securities.iloc[np.unique(codes, return_index=True)[1]]
+
+    # Stage one row per instrument, upsert them all and read the ids back in staging order:
+    # two statements, whatever the mix of known and new instruments
+    cols = ", ".join(SECURITY_COLUMNS)
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS staged_securities (security_key TEXT, {cols})")
+    conn.execute("DELETE FROM staged_securities")
+    conn.executemany(
+        f"INSERT INTO staged_securities (security_key, {cols}) VALUES ({', '.join('?' * (len(SECURITY_COLUMNS) + 1))})",
+        zip(keys, *(first[col].tolist() for col in SECURITY_COLUMNS))
+    )
+    # Issuers edit descriptions; the instrument keeps its id and takes the new text
+    conn.execute(
+        f"INSERT INTO securities (security_key, {cols}) SELECT security_key, {cols} FROM staged_securities WHERE true "
+        "ON CONFLICT (security_key) DO UPDATE SET description = excluded.description, asset_class = excluded.asset_class "
+        "WHERE securities.description IS NOT excluded.description OR securities.asset_class IS NOT excluded.asset_class"
+    )
+    ids = conn.execute(
+        "SELECT s.id FROM staged_securities t CROSS JOIN securities s USING (security_key) ORDER BY t.rowid"
+    ).fetchall()
+    return np.fromiter((row[0] for row in ids), dtype=np.int64, count=len(ids))[codes]
+
+def _snapshot_frame(conn, df):
+    """
+    A scraped frame as stored: POSITION_COLUMNS (None for missing values) plus file
+    position, indexed by (security_id, lot). Interns new instruments and adds a
+    security_id column to df, so callers can join it with stored snapshots.
+    """
     # Ensure all columns exist
-    for col in cols_to_keep:
+    for col in HOLDING_COLUMNS:
         if col not in df.columns:
             df[col] = None
-            
-    df_to_save = df[cols_to_keep]
-    
-    df_to_save.to_sql(table_name, conn, if_exists='append', index=False)
-    
-    conn.commit()
-    conn.close()
-    print(f"Saved {len(df)} records for {etf_ticker} on {date} into {table_name}")
+
+    values = df[HOLDING_COLUMNS].astype(object).where(df[HOLDING_COLUMNS].notna(), None)
+    security_ids = intern_securities(conn, values[SECURITY_COLUMNS])
+    df['security_id'] = security_ids
+
+    lots = pd.Series(security_ids).groupby(security_ids, sort=False).cumcount().to_numpy()
+    frame = values[POSITION_COLUMNS].set_axis(pd.MultiIndex.from_arrays([security_ids, lots], names=['security_id', 'lot']))
+    frame['position'] = np.arange(len(frame))
+    return frame
+
+def _read_snapshot(conn, etf_ticker, day, with_securities=False):
+    """
+    Rebuild one stored snapshot, indexed by (security_id, lot), or return None if it was
+    never saved. The state on `day` is the newest row per instrument between its base date
+    and `day`, unless that row is a tombstone; one range scan of idx_holdings_etf_date_security.
+    with_securities joins the instrument columns back in from the security master.
+    """
+    row = conn.execute("SELECT base_date FROM snapshots WHERE etf = ? AND date = ?", (etf_ticker, day)).fetchone()
+    if row is None:
+        return None
+
+    cols = ["h.security_id", "h.lot", "h.id", "h.position"] + [f"h.{col}" for col in POSITION_COLUMNS]
+    join = ""
+    if with_securities:
+        cols += [f"s.{col}" for col in SECURITY_COLUMNS]
+        join = "JOIN securities s ON s.id = h.security_id "
+    query = (
+        f"SELECT {', '.join(cols)} "
+        "FROM (SELECT security_id, lot, MAX(date) AS date FROM holdings "
+        "      WHERE etf = ? AND date BETWEEN ? AND ? GROUP BY security_id, lot) latest "
+        # CROSS JOIN keeps the planner from scanning all of the ETF's history through h
+        "CROSS JOIN holdings h "
+        "  ON h.etf = ? AND h.date = latest.date AND h.security_id = latest.security_id AND h.lot = latest.lot "
+        f"{join}"
+        "WHERE h.removed = 0 "
+        "ORDER BY h.position, h.id"
+    )
+    return pd.read_sql_query(query, conn, params=(etf_ticker, row[0], day, etf_ticker), index_col=['security_id', 'lot'])
+
+def _sort_keys(match, previous_keys):
+    """
+    Sort keys for the rows of a delta snapshot, in file order. match: each row's row in the
+    previous snapshot (-1 if new); previous_keys: that snapshot's keys, in its order.
+    Returns (keys, kept). Kept rows are the longest run of common rows still in their old
+    order and keep their old key, so they only need storing if their values changed; the
+    other rows get keys spaced evenly between their kept neighbours.
+    """
+    n = len(match)
+    common = np.flatnonzero(match >= 0)
+    # Longest strictly increasing subsequence of the old keys (patience sorting)
+    tails, tail_rows, parent = [], [], np.full(len(common), -1)
+    for i, key in enumerate(previous_keys[match[common]].tolist()):
+        j = bisect_left(tails, key)
+        if j:
+            parent[i] = tail_rows[j - 1]
+        if j == len(tails):
+            tails.append(key)
+            tail_rows.append(i)
+        else:
+            tails[j] = key
+            tail_rows[j] = i
+    chain, i = [], tail_rows[-1] if tail_rows else -1
+    while i >= 0:
+        chain.append(i)
+        i = parent[i]
+    kept = np.zeros(n, dtype=bool)
+    kept[common[chain]] = True
+    if not kept.any():
+        return np.arange(n, dtype=float), kept
+
+    # Each other row goes between the kept rows around it, with a kept row one step
+    # beyond either end of the file
+    anchors = np.flatnonzero(kept)
+    anchor_keys = previous_keys[match[anchors]].astype(float)
+    anchors = np.concatenate([[-1], anchors, [n]])
+    anchor_keys = np.concatenate([[anchor_keys[0] - anchors[1] - 1], anchor_keys, [anchor_keys[-1] + n - anchors[-2]]])
+    rows = np.flatnonzero(~kept)
+    after = np.searchsorted(anchors, rows)
+    lo, hi = anchors[after - 1], anchors[after]
+    keys = np.empty(n)
+    keys[anchors[1:-1]] = anchor_keys[1:-1]
+    keys[rows] = anchor_keys[after - 1] + (anchor_keys[after] - anchor_keys[after - 1]) * (rows - lo) / (hi - lo)
+    return keys, kept
+
+def _changed_keys(old, new):
+    """(security_id, lot) keys present in both frames whose position values differ."""
+    common = new.index.intersection(old.index)
+    a = new.loc[common, POSITION_COLUMNS].astype(object)
+    b = old.loc[common, POSITION_COLUMNS].astype(object)
+    differs = (a != b) & ~(a.isna() & b.isna())
+    return common[differs.any(axis=1).to_numpy()]
+
+def _upsert_rows(conn, etf_ticker, day, rows):
+    """
+    Make the holdings rows stored for (etf, day) exactly `rows`, as an upsert on
+    (etf, date, security_id, lot): identical rows are left untouched, others updated or
+    inserted, and stored rows whose key is not in `rows` deleted.
+    """
+    cols = ['security_id', 'lot', 'position', 'removed'] + POSITION_COLUMNS
+    placeholders = ", ".join("?" * (len(cols) + 2))
+    assignments = ", ".join(f"{col} = excluded.{col}" for col in cols[2:])
+    changed = " OR ".join(f"holdings.{col} IS NOT excluded.{col}" for col in cols[2:])
+
+    # Stage the keys to find stale rows in SQL
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS staged_rows (security_id INTEGER, lot INTEGER, PRIMARY KEY (security_id, lot))")
+    conn.execute("DELETE FROM staged_rows")
+    conn.executemany("INSERT OR IGNORE INTO staged_rows (security_id, lot) VALUES (?, ?)", ((row[2], row[3]) for row in rows))
+
+    conn.executemany(
+        f"INSERT INTO holdings (etf, date, {', '.join(cols)}) VALUES ({placeholders}) "
+        f"ON CONFLICT (etf, date, security_id, lot) DO UPDATE SET {assignments} WHERE {changed}",
+        rows
+    )
+    conn.execute(
+        "DELETE FROM holdings WHERE etf = ? AND date = ? AND NOT EXISTS ("
+        "SELECT 1 FROM staged_rows s WHERE s.security_id = holdings.security_id AND s.lot = holdings.lot)",
+        (etf_ticker, day)
+    )
+
+def _write_snapshot(conn, etf_ticker, day, frame, previous=None):
+    """
+    Store `frame` as the snapshot for (etf, day). In delta mode only the rows that differ
+    from the previous stored date are written (plus tombstones for removed instruments),
+    and a new full base is started every SNAPSHOT_BASE_INTERVAL snapshots. `previous` is
+    that date's snapshot if the caller has already read it.
+    Returns (base_date, rows written).
+    """
+    prev = conn.execute(
+        "SELECT date, base_date FROM snapshots WHERE etf = ? AND date < ? ORDER BY date DESC LIMIT 1",
+        (etf_ticker, day)
+    ).fetchone()
+
+    is_base = HOLDINGS_STORAGE != "delta" or prev is None
+    if not is_base:
+        chain_len = conn.execute(
+            "SELECT COUNT(*) FROM snapshots WHERE etf = ? AND base_date = ? AND date < ?",
+            (etf_ticker, prev['base_date'], day)
+        ).fetchone()[0]
+        is_base = chain_len >= SNAPSHOT_BASE_INTERVAL
+
+    if not is_base:
+        if previous is None:
+            previous = _read_snapshot(conn, etf_ticker, prev['date'])
+        # Rows that only moved are stored again with a new sort key, so the file order
+        # survives without restoring every row behind an insertion or removal
+        keys, kept = _sort_keys(previous.index.get_indexer(frame.index), previous['position'].to_numpy(dtype=float))
+        gaps = np.diff(keys)
+        # Keys squeezed too close by repeated reorders: start a new base instead
+        is_base = len(gaps) > 0 and gaps.min() < MIN_POSITION_GAP
+
+    if is_base:
+        base_date, stored, removed_keys = day, frame, []
+        positions = np.arange(len(frame)).tolist()
+    else:
+        changed = frame.index.isin(_changed_keys(previous, frame))
+        base_date, stored = prev['base_date'], frame[~kept | changed]
+        positions = [int(k) if k.is_integer() else k for k in keys[~kept | changed].tolist()]
+        removed_keys = previous.index.difference(frame.index)
+
+    values = stored[POSITION_COLUMNS].astype(object).where(stored[POSITION_COLUMNS].notna(), None)
+    rows = [
+        (etf_ticker, day, int(security_id), int(lot), position, 0, *row)
+        for (security_id, lot), position, row in zip(stored.index, positions, values.itertuples(index=False, name=None))
+    ]
+    empty = (None,) * len(POSITION_COLUMNS)
+    rows.extend((etf_ticker, day, int(security_id), int(lot), None, 1, *empty) for security_id, lot in removed_keys)
+
+    _upsert_rows(conn, etf_ticker, day, rows)
+    # Upsert so re-encoding a date keeps its catalog figures
+    conn.execute(
+        "INSERT INTO snapshots (etf, date, base_date) VALUES (?, ?, ?) "
+        "ON CONFLICT (etf, date) DO UPDATE SET base_date = excluded.base_date",
+        (etf_ticker, day, base_date)
+    )
+    return base_date, len(rows)
+
+def _numeric_values(frame, rows):
+    """POSITION_COLUMNS of some rows of a snapshot frame as float arrays; all NaN if rows is a count."""
+    if isinstance(rows, int):
+        return [np.full(rows, np.nan)] * len(POSITION_COLUMNS)
+    return [pd.to_numeric(frame[col].iloc[rows], errors='coerce').to_numpy(dtype=float) for col in POSITION_COLUMNS]
+
+def _diff_rows(etf_ticker, day, today, yesterday):
+    """
+    holding_changes rows of two snapshot frames (indexed by (security_id, lot), in file
+    order; yesterday None for an ETF's first date). This is compare_holdings() as an
+    index join: securities are keyed by its instrument key, and lots number the repeats
+    of an instrument in file order, just as it pairs them.
+    """
+    if yesterday is None:
+        yesterday = today.iloc[:0]
+    match = yesterday.index.get_indexer(today.index)
+    held = match >= 0
+    sold = np.ones(len(yesterday), dtype=bool)
+    sold[match[held]] = False
+
+    common = np.flatnonzero(held)
+    change = _numeric_values(today, common)[0] - _numeric_values(yesterday, match[held])[0]
+    new, gone = np.flatnonzero(~held), np.flatnonzero(sold)
+    # NaN changes (shares missing on either day) fall in neither
+    increased, decreased = common[change > 0], common[change < 0]
+
+    # kind, frame its position and security refer to, rows of it, today's rows, yesterday's rows
+    kinds = [
+        ('new', today, new, new, len(new)),
+        ('sold', yesterday, gone, len(gone), gone),
+        ('increased', today, increased, increased, match[increased]),
+        ('decreased', today, decreased, decreased, match[decreased]),
+    ]
+    for kind, frame, positions, today_rows, yesterday_rows in kinds:
+        pairs = zip(_numeric_values(today, today_rows), _numeric_values(yesterday, yesterday_rows))
+        values = [np.where(np.isnan(v), None, v) for pair in pairs for v in pair]
+        security_ids = frame.index.get_level_values('security_id')[positions]
+        yield from zip(repeat(etf_ticker), repeat(day), repeat(kind), positions.tolist(), security_ids.tolist(), *values)
+
+def _write_changes(conn, etf_ticker, day, today=None, previous=None):
+    """
+    Store the changes of (etf, day) against the previous stored date in holding_changes.
+    today, previous: the two snapshots as stored (see _read_snapshot), in file order;
+    read from the database when not given.
+    """
+    prev = conn.execute(
+        "SELECT date FROM snapshots WHERE etf = ? AND date < ? ORDER BY date DESC LIMIT 1", (etf_ticker, day)
+    ).fetchone()
+    if today is None:
+        today = _read_snapshot(conn, etf_ticker, day)
+    if prev and previous is None:
+        previous = _read_snapshot(conn, etf_ticker, prev[0])
+
+    conn.execute("DELETE FROM holding_changes WHERE etf = ? AND date = ?", (etf_ticker, day))
+    conn.executemany(
+        f"INSERT INTO holding_changes VALUES ({', '.join('?' * 11)})",
+        _diff_rows(etf_ticker, day, today, previous if prev else None)
+    )
+    conn.execute(
+        "UPDATE snapshots SET changes_from = ? WHERE etf = ? AND date = ?",
+        (prev[0] if prev else 0, etf_ticker, day)
+    )
+
+def save_holdings(date, etf_ticker, df, payload_hash=None):
+    """
+    Store an ETF's snapshot for a date in one transaction, with its changes against the
+    previous date (see get_holding_changes). Saving a date again is an idempotent upsert;
+    saving a date before the latest one re-encodes the later deltas and re-diffs the next
+    date. Adds a security_id column to df. Returns {'inserted': n, 'updated': n, 'removed': n,
+    'unchanged': n}, counted against the snapshot previously stored for the same date.
+    """
+    day = date_to_int(date)
+
+    with transaction() as conn:
+        frame = _snapshot_frame(conn, df)
+        current = _read_snapshot(conn, etf_ticker, day)
+        # Read once: the delta is encoded and the changes diffed against it
+        prev = conn.execute(
+            "SELECT date FROM snapshots WHERE etf = ? AND date < ? ORDER BY date DESC LIMIT 1", (etf_ticker, day)
+        ).fetchone()
+        previous = _read_snapshot(conn, etf_ticker, prev[0]) if prev else None
+
+        # Later deltas are relative to this date, so rebuild them before it changes
+        later = [r[0] for r in conn.execute(
+            "SELECT date FROM snapshots WHERE etf = ? AND date > ? ORDER BY date", (etf_ticker, day)
+        )]
+        rebuilt = [(d, _read_snapshot(conn, etf_ticker, d)) for d in later]
+
+        base_date, written = _write_snapshot(conn, etf_ticker, day, frame, previous)
+        for d, later_frame in rebuilt:
+            _write_snapshot(conn, etf_ticker, d, later_frame)
+
+        _write_changes(conn, etf_ticker, day, frame, previous)
+        if later:
+            # The next date is now diffed against this one
+            _write_changes(conn, etf_ticker, later[0], rebuilt[0][1], frame)
+
+        catalog = _snapshot_stats(df)
+        conn.execute(
+            "UPDATE snapshots SET row_count = ?, market_value = ?, option_count = ?, payload_hash = ?, ingested_at = ? "
+            "WHERE etf = ? AND date = ?",
+            (catalog['row_count'], catalog['market_value'], catalog['option_count'], payload_hash,
+             datetime.now().isoformat(timespec='seconds'), etf_ticker, day)
+        )
+
+    if current is None:
+        stats = {'inserted': len(frame), 'updated': 0, 'removed': 0, 'unchanged': 0}
+    else:
+        updated = len(_changed_keys(current, frame))
+        inserted = int((~frame.index.isin(current.index)).sum())
+        stats = {
+            'inserted': inserted,
+            'updated': updated,
+            'removed': len(current.index.difference(frame.index)),
+            'unchanged': len(frame) - inserted - updated,
+        }
+
+    # The date changed and the later ones were re-encoded (new row ids)
+    _snapshot_cache.invalidate(etf_ticker, from_date=date)
+
+    if ARCHIVE_HOLDINGS:
+        # Imported here: archive needs pyarrow and imports this module. The database is the
+        # source of truth, so a failed export only leaves a gap `archive.py export` can fill.
+        import archive
+        try:
+            archive.export_snapshot(etf_ticker, date, df)
+        except Exception as e:
+            print(f"Could not archive {etf_ticker} on {date}: {e}")
+
+    kind = "base" if base_date == day else "delta"
+    print(
+        f"Saved {len(df)} records for {etf_ticker} on {date} "
+        f"({stats['inserted']} inserted, {stats['updated']} updated, {stats['removed']} removed; "
+        f"{kind} snapshot, {written} rows stored)"
+    )
+    return stats
 
 def get_holdings(date, etf_ticker):
-    conn = sqlite3.connect(DB_PATH)
-    table_name = f"holdings_{etf_ticker}"
+    """
+    The snapshot of an ETF on a date, served from the snapshot cache when possible.
+    The frame is the caller's own copy; modifying it does not affect the cache.
+    """
+    key = (DB_PATH, etf_ticker, date)
+    cached = _snapshot_cache.get(key)
+    if cached is not None:
+        return cached
+
+    columns = ['id', 'date', 'security_id'] + HOLDING_COLUMNS
+    generation = _snapshot_cache.generation
     try:
-        query = f"SELECT * FROM {table_name} WHERE date = ?"
-        df = pd.read_sql_query(query, conn, params=(date,))
+        with db_connection() as conn:
+            frame = _read_snapshot(conn, etf_ticker, date_to_int(date), with_securities=True)
     except Exception:
-        df = pd.DataFrame()
-    conn.close()
+        return pd.DataFrame()
+    if frame is None:
+        return pd.DataFrame(columns=columns)
+
+    df = frame.reset_index()
+    df['date'] = date
+    df = df[columns]
+    _snapshot_cache.put(key, df, generation)
     return df
 
+def get_holding_changes(date, etf_ticker):
+    """
+    compare_holdings() of an ETF's snapshot on a date against the previous stored one, as
+    materialized at ingest: a dict of 'new', 'sold', 'increased' and 'decreased' frames
+    with date, security_id and HOLDING_COLUMNS (yesterday's values for 'sold'); increased
+    and decreased add <col>_today / <col>_yesterday and shares_change. Unchanged
+    holdings are not included. Rows are in file order; frames are empty for unknown dates.
+    """
+    values = [f"{col}_{day}" for col in POSITION_COLUMNS for day in ('today', 'yesterday')]
+    query = (
+        f"SELECT c.change, c.security_id, {', '.join(f's.{col}' for col in SECURITY_COLUMNS)}, "
+        f"{', '.join(f'c.{col}' for col in values)} "
+        "FROM holding_changes c JOIN securities s ON s.id = c.security_id "
+        "WHERE c.etf = ? AND c.date = ? ORDER BY c.change, c.position"
+    )
+    try:
+        with db_connection() as conn:
+            rows = pd.read_sql_query(query, conn, params=(etf_ticker, date_to_int(date)))
+    except Exception:
+        rows = pd.DataFrame(columns=['change', 'security_id'] + SECURITY_COLUMNS + values)
+
+    # Built from column arrays: the frames are small, so pandas overhead is most of the cost
+    kinds = rows['change'].to_numpy()
+    columns = {col: rows[col].to_numpy() for col in rows.columns}
+    diffs = {}
+    for kind in CHANGE_KINDS:
+        rows_of_kind = kinds == kind
+        day = 'yesterday' if kind == 'sold' else 'today'
+        frame = {'date': date, 'security_id': columns['security_id'][rows_of_kind]}
+        for col in HOLDING_COLUMNS:
+            frame[col] = columns[f"{col}_{day}" if col in POSITION_COLUMNS else col][rows_of_kind]
+        if kind in ('increased', 'decreased'):
+            frame.update((col, columns[col][rows_of_kind]) for col in values)
+            frame['shares_change'] = frame['shares_today'] - frame['shares_yesterday']
+        diffs[kind] = pd.DataFrame(frame)
+    return diffs
+
+def _resolve_instruments(conn, instruments, option_type=None):
+    """
+    The securities behind each instrument: a holding_ticker (every security that carries
+    it, e.g. option legs across strikes and expiries; only the `option_type` ones if
+    given) or a security_id. Returns a frame of security_id, instrument (as given),
+    strike_price and expiration_date.
+    """
+    columns = ['security_id', 'instrument', 'strike_price', 'expiration_date']
+    frames = [pd.DataFrame(columns=columns)]
+    tickers = [i for i in instruments if isinstance(i, str)]
+    if tickers:
+        query = (
+            "SELECT id AS security_id, holding_ticker AS instrument, strike_price, expiration_date "
+            f"FROM securities WHERE holding_ticker IN ({', '.join('?' * len(tickers))})"
+        )
+        if option_type:
+            query += " AND option_type = ?"
+        frames.append(pd.read_sql_query(query, conn, params=tickers + ([option_type] if option_type else [])))
+    ids = [i for i in instruments if not isinstance(i, str)]
+    if ids:
+        found = pd.read_sql_query(
+            f"SELECT id AS security_id, strike_price, expiration_date FROM securities WHERE id IN ({', '.join('?' * len(ids))})",
+            conn, params=[int(i) for i in ids]
+        )
+        frames.append(pd.DataFrame({'security_id': [int(i) for i in ids], 'instrument': ids}).merge(found, on='security_id'))
+    legs = pd.concat(frames, ignore_index=True)
+    return legs.astype({'security_id': 'int64', 'strike_price': float}).assign(
+        expiration_date=pd.to_datetime(legs['expiration_date'], errors='coerce', format='%Y-%m-%d')
+    )
+
+def _position_frame(conn, etf_ticker, security_ids, start, end):
+    """
+    The positions of `security_ids` (None: every instrument) in every snapshot between
+    start and end: returns the snapshot dates and a long frame of (date, security_id, lot,
+    position, POSITION_COLUMNS), one row per lot held. A delta snapshot only stores
+    changes, so each date takes the newest row of its own base chain, as in _read_snapshot;
+    one range scan of idx_holdings_etf_security_date (of idx_holdings_etf_date_security
+    for every instrument).
+    """
+    snaps = pd.read_sql_query(
+        "SELECT date, base_date FROM snapshots WHERE etf = ? AND date BETWEEN ? AND ? ORDER BY date",
+        conn, params=(etf_ticker, date_to_int(start) if start else 0, date_to_int(end) if end else 99999999)
+    )
+    columns = ['date', 'security_id', 'lot', 'position'] + POSITION_COLUMNS
+    if snaps.empty or security_ids == []:
+        return snaps['date'], pd.DataFrame(columns=columns)
+
+    query = f"SELECT security_id, lot, date AS row_date, removed, position, {', '.join(POSITION_COLUMNS)} FROM holdings WHERE etf = ? "
+    params = [etf_ticker]
+    if security_ids is not None:
+        query += f"AND security_id IN ({', '.join('?' * len(security_ids))}) "
+        params += security_ids
+    rows = pd.read_sql_query(
+        query + "AND date BETWEEN ? AND ?",
+        conn, params=(*params, int(snaps['base_date'].min()), int(snaps['date'].max()))
+    ).sort_values('row_date')  # sorted here: ORDER BY date would steer SQLite onto the date index
+    grid = snaps.merge(rows[['security_id', 'lot']].drop_duplicates(), how='cross')
+    latest = pd.merge_asof(
+        grid.sort_values('date'), rows, left_on='date', right_on='row_date', by=['security_id', 'lot']
+    )
+    # A row from an earlier chain does not carry over, and a tombstone means not held
+    held = (latest['row_date'] >= latest['base_date']) & (latest['removed'] == 0)
+    return snaps['date'], latest.loc[held, columns]
+
+def _leg_frame(conn, etf_ticker, instruments, start, end, option_type=None):
+    """
+    The position behind each instrument on every snapshot date between start and end:
+    returns the snapshot dates and a frame of (date, instrument, security_id,
+    POSITION_VALUES), one row per instrument per date it was held. Lots of a security are
+    summed, but legs are never added together: an instrument with several (a ticker across
+    option strikes and expiries) takes the held leg expiring first that day, and of those
+    the largest by absolute shares.
+    """
+    legs = _resolve_instruments(conn, instruments, option_type)
+    days, positions = _position_frame(conn, etf_ticker, legs['security_id'].unique().tolist(), start, end)
+    positions = positions.astype({'security_id': 'int64', **{col: float for col in POSITION_COLUMNS}})
+    held = positions.groupby(['date', 'security_id'], as_index=False)[POSITION_COLUMNS].sum(min_count=1).merge(legs, on='security_id')
+    held['size'] = -held['shares'].abs()
+    front = held.sort_values(['expiration_date', 'size', 'security_id'], na_position='last').drop_duplicates(['date', 'instrument'])
+    return days, front[['date', 'instrument', 'security_id'] + POSITION_VALUES]
+
+def _date_index(days):
+    return pd.DatetimeIndex(pd.to_datetime(pd.Series(days, dtype='int64').astype(str), format='%Y%m%d'), name='date')
+
+_VALUE_DTYPES = {'security_id': 'Int64', **{col: float for col in POSITION_COLUMNS}, 'strike_price': float, 'expiration_date': 'datetime64[ns]'}
+
+def get_position_history(etf_ticker, instrument, start=None, end=None, option_type=None):
+    """
+    An instrument's position in an ETF on every snapshot date between start and end
+    ('YYYY-MM-DD', inclusive): shares, market value and weight, and the security_id,
+    strike_price and expiration_date of the leg they belong to. instrument is a
+    holding_ticker or a security_id; a ticker naming several option legs follows the
+    front-month one (see _leg_frame), of type option_type ('Call' or 'Put') if given.
+    Returns a frame indexed by date; rows are NaN on dates it was not held.
+    """
+    columns = ['security_id'] + POSITION_VALUES
+    try:
+        with db_connection() as conn:
+            days, legs = _leg_frame(conn, etf_ticker, [instrument], start, end, option_type)
+    except Exception:
+        return pd.DataFrame(columns=columns, index=_date_index([])).astype(_VALUE_DTYPES)
+
+    history = legs.set_index('date')[columns].reindex(days)
+    history.index = _date_index(days)
+    return history.astype(_VALUE_DTYPES)
+
+def get_position_pivot(etf_ticker, instruments, start=None, end=None, value='shares', option_type=None):
+    """
+    One of POSITION_VALUES for several instruments side by side: a frame indexed by
+    snapshot date with one column per instrument (in the order given), NaN where not held.
+    Each instrument is one leg per date, as in get_position_history; e.g. value='strike_price'
+    with option_type='Call' tracks the strike of a fund's front-month call.
+    """
+    if value not in POSITION_VALUES:
+        raise ValueError(f"value must be one of {POSITION_VALUES}, not {value!r}")
+    instruments = list(instruments)
+    dtype = _VALUE_DTYPES[value]
+    try:
+        with db_connection() as conn:
+            days, legs = _leg_frame(conn, etf_ticker, instruments, start, end, option_type)
+    except Exception:
+        return pd.DataFrame(columns=instruments, index=_date_index([])).astype(dtype)
+
+    pivot = legs.pivot(index='date', columns='instrument', values=value).reindex(index=days, columns=instruments)
+    pivot.index = _date_index(days)
+    pivot.columns.name = None
+    return pivot.astype(dtype)
+
+def get_holdings_window(etf_ticker, start=None, end=None, count=None):
+    """
+    Every holding of an ETF in each snapshot between start and end ('YYYY-MM-DD',
+    inclusive), or in the `count` snapshots up to end. Returns (dates, frame): the
+    snapshot dates oldest first, and one row per lot held per date with 'date',
+    security_id, lot, position, POSITION_COLUMNS and SECURITY_COLUMNS, in file order.
+    """
+    columns = ['date', 'security_id', 'lot', 'position'] + POSITION_COLUMNS + SECURITY_COLUMNS
+    try:
+        with db_connection() as conn:
+            if count:
+                row = conn.execute(
+                    "SELECT date FROM snapshots WHERE etf = ? AND date <= ? ORDER BY date DESC LIMIT 1 OFFSET ?",
+                    (etf_ticker, date_to_int(end) if end else 99999999, count - 1)
+                ).fetchone()
+                start = max(start or '', int_to_date(row[0])) if row else start
+            days, positions = _position_frame(conn, etf_ticker, None, start, end)
+            ids = positions['security_id'].unique().tolist()
+            securities = pd.read_sql_query(
+                f"SELECT id AS security_id, {', '.join(SECURITY_COLUMNS)} FROM securities "
+                f"WHERE id IN ({', '.join('?' * len(ids))})",
+                conn, params=ids
+            )
+    except Exception:
+        return [], pd.DataFrame(columns=columns)
+
+    dates = [int_to_date(day) for day in days]
+    frame = positions.merge(securities, on='security_id', how='left').sort_values(['date', 'position'], ignore_index=True)
+    # Stored positions are sort keys (see _sort_keys); hand out row numbers in the file
+    frame['position'] = frame.groupby('date').cumcount()
+    frame['date'] = frame['date'].map(dict(zip(days, dates)))
+    return dates, frame[columns]
+
+def _reencode(conn, etf_ticker, read):
+    """
+    Re-store every snapshot of an ETF from read(day) (a frame as _snapshot_frame returns),
+    oldest first. The new encoding is built under a scratch key from the untouched history
+    and swapped in at the end, since re-encoding a date in place would change what the
+    later deltas are relative to. Returns the dates; call inside a transaction.
+    """
+    scratch = f"{etf_ticker}~compact"
+    days = [r[0] for r in conn.execute("SELECT date FROM snapshots WHERE etf = ? ORDER BY date", (etf_ticker,))]
+    for day in days:
+        _write_snapshot(conn, scratch, day, read(day))
+    conn.execute("DELETE FROM holdings WHERE etf = ?", (etf_ticker,))
+    conn.execute("UPDATE holdings SET etf = ? WHERE etf = ?", (etf_ticker, scratch))
+    # Only the base dates change; the catalog figures stay with the ticker's rows
+    conn.execute(
+        "UPDATE snapshots SET base_date = s.base_date FROM snapshots s "
+        "WHERE s.etf = ? AND s.date = snapshots.date AND snapshots.etf = ?",
+        (scratch, etf_ticker)
+    )
+    conn.execute("DELETE FROM snapshots WHERE etf = ?", (scratch,))
+    _snapshot_cache.invalidate(etf_ticker)
+    return days
+
+def compact_holdings(etf_ticker=None):
+    """
+    Re-encode stored history with the current storage mode (e.g. full snapshots saved
+    before delta storage existed), then VACUUM to return the space.
+    """
+    conn = get_db_connection()
+    tickers = [etf_ticker] if etf_ticker else [r[0] for r in conn.execute("SELECT DISTINCT etf FROM snapshots")]
+    for ticker in tickers:
+        with transaction():
+            days = _reencode(conn, ticker, lambda day: _read_snapshot(conn, ticker, day))
+        print(f"Re-encoded {len(days)} snapshots for {ticker}")
+    conn.execute("VACUUM")
+
 def get_latest_date(etf_ticker):
-    conn = sqlite3.connect(DB_PATH)
-    table_name = f"holdings_{etf_ticker}"
-    c = conn.cursor()
+    dates = get_recent_dates(etf_ticker, limit=1)
+    return dates[0] if dates else None
+
+def get_recent_dates(etf_ticker, limit=2):
+    """Return the most recent snapshot dates for an ETF, newest first ('YYYY-MM-DD')."""
+    try:
+        with db_connection() as conn:
+            # Walks the snapshots primary key backwards, so the cost does not grow with history
+            rows = conn.execute(
+                "SELECT date FROM snapshots WHERE etf = ? ORDER BY date DESC LIMIT ?",
+                (etf_ticker, limit)
+            ).fetchall()
+        return [int_to_date(row[0]) for row in rows]
+    except Exception:
+        return []
+
+def get_previous_date(etf_ticker, date):
+    """Return the latest snapshot date before `date` for an ETF ('YYYY-MM-DD'), or None."""
     try:
-        c.execute(f"SELECT MAX(date) FROM {table_name}")
-        result = c.fetchone()
+        with db_connection() as conn:
+            # One probe of the snapshots primary key
+            row = conn.execute(
+                "SELECT date FROM snapshots WHERE etf = ? AND date < ? ORDER BY date DESC LIMIT 1",
+                (etf_ticker, date_to_int(date))
+            ).fetchone()
+        return int_to_date(row[0]) if row else None
+    except Exception:
+        return None
+
+def list_snapshots(etf_ticker=None, limit=None):
+    """
+    Return the snapshot catalog, newest first, as a list of dicts with etf, date
+    ('YYYY-MM-DD'), row_count, market_value, option_count, payload_hash and ingested_at.
+    """
+    query = f"SELECT etf, date, {', '.join(CATALOG_COLUMNS)} FROM snapshots"
+    params = []
+    if etf_ticker:
+        query += " WHERE etf = ?"
+        params.append(etf_ticker)
+    query += " ORDER BY date DESC, etf"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    try:
+        with db_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+    except Exception:
+        return []
+    return [dict(row, date=int_to_date(row['date'])) for row in rows]
+
+def get_last_payload_hash(etf_ticker):
+    """Return the payload hash of the most recent snapshot for an ETF, or None."""
+    try:
+        with db_connection() as conn:
+            result = conn.execute(
+                "SELECT payload_hash FROM snapshots WHERE etf = ? ORDER BY date DESC LIMIT 1",
+                (etf_ticker,)
+            ).fetchone()
         return result[0] if result else None
     except Exception:
         return None
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
     init_db()
     print("Database initialized.")
+    if sys.argv[1:] == ["compact"]:
+        compact_holdings()
@@ -0,0 +1,147 @@
+import asyncio
+import atexit
+import queue
+import threading
+import time
+import weakref
+from collections import deque
+import database
+from config import DB_WORKER_QUEUE_SIZE
+
+class DatabaseWorker:
+    """
+    Runs database calls for async code (the bot) on one dedicated thread, so a SQLite
+    round-trip or a frame build never blocks the event loop:
+
+        latest = await get_db_worker().run(get_latest_date, "QQQI")
+
+    Calls run one at a time in submission order, on the worker thread's own connection.
+    At most `max_pending` calls per event loop are queued or running; further callers
+    wait (asynchronously) for a slot. stats() reports queue depth and per-function latency.
+    """
+
+    def __init__(self, max_pending=DB_WORKER_QUEUE_SIZE, window=500):
+        self.max_pending = max_pending
+        self.pending = 0
+        self.high_water = 0
+        self._window = window
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._slots = weakref.WeakKeyDictionary()
+        self._metrics = {}
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="db-worker", daemon=True)
+                self._thread.start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            fn, args, kwargs, loop, future, queued_at = job
+            started = time.perf_counter()
+            result = error = None
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                error = e
+            finished = time.perf_counter()
+            self._record(fn.__name__, started - queued_at, finished - started, error is not None)
+            try:
+                loop.call_soon_threadsafe(self._finish, loop, future, result, error)
+            except RuntimeError:
+                pass  # The caller's loop has closed; nobody is waiting for the result
+        database.close_db_connection()
+
+    def _finish(self, loop, future, result, error):
+        # Runs on the caller's loop
+        self.pending -= 1
+        self._slots[loop].release()
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _record(self, name, wait, run, failed):
+        with self._lock:
+            metrics = self._metrics.get(name)
+            if metrics is None:
+                metrics = self._metrics[name] = {
+                    'calls': 0, 'errors': 0, 'wait': 0.0, 'run': 0.0, 'max': 0.0,
+                    'recent': deque(maxlen=self._window),
+                }
+            metrics['calls'] += 1
+            metrics['errors'] += failed
+            metrics['wait'] += wait
+            metrics['run'] += run
+            metrics['max'] = max(metrics['max'], wait + run)
+            metrics['recent'].append(wait + run)
+
+    async def run(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) run on the worker thread; its exceptions are re-raised here."""
+        self._start()
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(self.max_pending)
+        await slots.acquire()
+
+        # The slot is released in _finish once the call has run, even if this caller is cancelled
+        self.pending += 1
+        self.high_water = max(self.high_water, self.pending)
+        future = loop.create_future()
+        self._queue.put((fn, args, kwargs, loop, future, time.perf_counter()))
+        return await future
+
+    def stats(self):
+        """
+        Queue depth and per-function latency: {'pending', 'high_water', 'calls': {name:
+        {'calls', 'errors', 'avg_wait_ms', 'avg_run_ms', 'p95_ms', 'max_ms'}}}. Wait is time
+        spent queued, run is time on the worker; p95 is over the last `window` calls.
+        """
+        with self._lock:
+            calls = {}
+            for name, m in self._metrics.items():
+                recent = sorted(m['recent'])
+                calls[name] = {
+                    'calls': m['calls'],
+                    'errors': m['errors'],
+                    'avg_wait_ms': m['wait'] / m['calls'] * 1000,
+                    'avg_run_ms': m['run'] / m['calls'] * 1000,
+                    'p95_ms': recent[int(0.95 * (len(recent) - 1))] * 1000,
+                    'max_ms': m['max'] * 1000,
+                }
+        return {'pending': self.pending, 'high_water': self.high_water, 'calls': calls}
+
+    def shutdown(self, timeout=10):
+        """Let queued calls finish, then stop the worker thread. Safe to call more than once."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def get_db_worker():
+    """Return the process-wide DatabaseWorker, creating it on first use."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = DatabaseWorker()
+            atexit.register(_worker.shutdown)
+        return _worker
+
+def shutdown_db_worker():
+    """Stop the database worker if it was ever started."""
+    if _worker is not None:
+        _worker.shutdown()
@@ -0,0 +1,70 @@
+import json
+import os
+import threading
+import time
+import config
+from config import ENDPOINT_CACHE_TTL
+
+# Download endpoints discovered by the browser scrapers, so later runs can skip Chromium.
+# File layout: {key: {"url": ..., "headers": {...}, "discovered_at": epoch_seconds}}
+
+# The only request headers stored: enough to replay a download, never cookies,
+# authorization or session tokens (the file is plaintext)
+REPLAY_HEADERS = {'accept', 'accept-language', 'referer', 'user-agent'}
+
+_lock = threading.Lock()
+
+def replay_headers(headers):
+    """The REPLAY_HEADERS among headers."""
+    return {k: v for k, v in headers.items() if k.lower() in REPLAY_HEADERS}
+
+def _load():
+    if not os.path.exists(config.ENDPOINT_CACHE_PATH):
+        return {}
+    try:
+        with open(config.ENDPOINT_CACHE_PATH, "r") as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable endpoint cache: {e}")
+        return {}
+    # Caches written before REPLAY_HEADERS kept every header; scrub them on first read
+    scrubbed = False
+    for entry in entries.values():
+        headers = replay_headers(entry.get("headers", {}))
+        if headers != entry.get("headers", {}):
+            entry["headers"] = headers
+            scrubbed = True
+    if scrubbed:
+        _save(entries)
+    return entries
+
+def _save(entries):
+    # Write atomically so a crash never leaves a half-written cache
+    tmp_path = f"{config.ENDPOINT_CACHE_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp_path, config.ENDPOINT_CACHE_PATH)
+
+def get_endpoint(key, ttl=ENDPOINT_CACHE_TTL):
+    """Return the cached endpoint for key, or None if missing or older than ttl seconds."""
+    with _lock:
+        entry = _load().get(key)
+    if entry is None:
+        return None
+    if time.time() - entry.get("discovered_at", 0) > ttl:
+        print(f"Cached endpoint for {key} expired.")
+        return None
+    return entry
+
+def save_endpoint(key, url, headers):
+    with _lock:
+        entries = _load()
+        entries[key] = {"url": url, "headers": replay_headers(headers), "discovered_at": time.time()}
+        _save(entries)
+    print(f"Cached download endpoint for {key}: {url}")
+
+def invalidate_endpoint(key):
+    with _lock:
+        entries = _load()
+        if entries.pop(key, None) is not None:
+            _save(entries)
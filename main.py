@@ -2,16 +2,10 @@ import sys
 from datetime import datetime
 import pandas as pd
 from config import ETFS
-from database import init_db, save_holdings, get_latest_date, get_holdings
-from scrapers import QQQIScraper, GPIQScraper, QYLDScraper, QDTEScraper
-from report import compare_holdings, analyze_options, generate_report, generate_options_only_report, generate_positions_only_report
-
-def get_scraper(class_name):
-    if class_name == "QQQIScraper": return QQQIScraper()
-    if class_name == "GPIQScraper": return GPIQScraper()
-    if class_name == "QYLDScraper": return QYLDScraper()
-    if class_name == "QDTEScraper": return QDTEScraper()
-    return None
+from browser import shutdown_browser_pool
+from database import init_db, save_holdings, get_latest_date, get_holdings, get_holding_changes, close_db_connection
+from orchestrator import scrape_all_sync
+from report import position_changes, analyze_options, OptionsAnalysis, ReportWriter
 
 def main():
     print("Initializing Database...")
@@ -22,91 +16,64 @@ def main():
 
     # Target ETFs
     target_tickers = ["QQQI", "GPIQ", "QYLD", "QDTE"]
-    all_reports = []
-    all_options_reports = []
-    all_positions_reports = []
+
+    # 1. Scrape all ETFs concurrently
+    target_tickers = [t for t in target_tickers if t in ETFS]
+    scrape_results = scrape_all_sync(target_tickers)
     
-    for ticker in target_tickers:
-        if ticker not in ETFS:
-            continue
+    # Combined, options-only and positions-only reports are streamed to their files
+    # one ETF at a time, separated by rules. The files are rewritten on every run, so an
+    # ETF not saved by this run keeps its section if an earlier run today stored it.
+    with ReportWriter(today) as writer:
+        for ticker in target_tickers:
+            print(f"\nProcessing {ticker}...")
             
-        print(f"\nProcessing {ticker}...")
-        
-        # 1. Scrape
-        scraper = get_scraper(ETFS[ticker]["scraper_class"])
-        if not scraper:
-            print(f"No scraper found for {ticker}")
-            continue
+            result = scrape_results[ticker]
+            if result.ok and not result.unchanged:
+                df_current = result.df
+                print(f"Scraped {len(df_current)} records.")
+                
+                # 2. Save Current Data (also diffs it against the previous snapshot)
+                save_holdings(today, ticker, df_current, payload_hash=result.payload_hash)
+            else:
+                if result.unchanged:
+                    print(f"{ticker} unchanged since last snapshot. Skipping save.")
+                else:
+                    print(f"Failed to scrape {ticker}: {result.summary()}")
+                if get_latest_date(ticker) != today:
+                    continue
+                df_current = get_holdings(today, ticker)
+                print(f"Using the snapshot already stored for {today}.")
             
-        df_current = scraper.fetch_holdings()
-        
-        if df_current.empty:
-            print(f"Failed to scrape {ticker}")
-            continue
+            # 3. Write Report Sections
+            diffs = get_holding_changes(today, ticker)
+            options = analyze_options(df_current, ticker, as_of=today)
+            writer.add(ticker, diffs, options, df_current)
             
-        print(f"Scraped {len(df_current)} records.")
-        
-        # 2. Get Previous Data
-        last_date = get_latest_date(ticker)
-        df_yesterday = None
-        if last_date:
-            print(f"Found previous data from {last_date}")
-            df_yesterday = get_holdings(last_date, ticker)
-        else:
-            print("No history found.")
-
-        # 3. Save Current Data
-        save_holdings(today, ticker, df_current)
-        
-        # 4. Generate Report Sections
-        diffs = compare_holdings(df_current, df_yesterday)
-        opts_summary, lower, upper = analyze_options(df_current)
-        
-        # Standard report
-        report_text = generate_report(today, ticker, diffs, opts_summary)
-        all_reports.append(report_text)
-        
-        # Options-only report
-        options_report_text = generate_options_only_report(today, ticker, diffs, opts_summary, df_current)
-        all_options_reports.append(options_report_text)
-        
-        # Positions-only report (just the table)
-        positions_report_text = generate_positions_only_report(today, ticker, df_current)
-        all_positions_reports.append(positions_report_text)
-        
-        # Output progress to console
-        print(f"Generated report sections for {ticker}")
+            # Output progress to console
+            print(f"Generated report sections for {ticker}")
 
-    # 5. Save Combined Reports
-    if all_reports:
-        combined_filename = f"combined_report_{today}.md"
-        with open(combined_filename, "w") as f:
-            # Join reports with clear separators
-            f.write("\n\n---\n\n".join(all_reports))
+    # 4. Report Files
+    if writer.paths:
+        combined_filename, options_filename, positions_filename = writer.paths
         print(f"\nSuccessfully generated combined report: {combined_filename}")
-    else:
-        print("\nNo reports generated.")
-    
-    if all_options_reports:
-        options_filename = f"options_only_report_{today}.md"
-        with open(options_filename, "w") as f:
-            # Join options reports with clear separators
-            f.write("\n\n---\n\n".join(all_options_reports))
         print(f"Successfully generated options-only report: {options_filename}")
-    
-    if all_positions_reports:
-        positions_filename = f"positions_only_report_{today}.md"
-        with open(positions_filename, "w") as f:
-            # Join positions reports with clear separators
-            f.write("\n\n---\n\n".join(all_positions_reports))
         print(f"Successfully generated positions-only report: {positions_filename}")
+    else:
+        print("\nNo reports generated.")
+
+    # 5. Generate Image Reports
+    unchanged = {t for t in target_tickers if scrape_results[t].unchanged}
+    if unchanged and len(unchanged) == len(target_tickers):
+        print("\nAll holdings unchanged since last snapshot. Skipping image reports.")
+        return
 
-    # 6. Generate Image Reports
     print("\nGenerating Image Reports...")
     from visualizer import TableVisualizer
     
     # Store data for consolidated reports
     all_current_holdings = []
+    all_options = []
     all_diffs_collection = {'new': [], 'sold': [], 'increased': [], 'decreased': []}
     
     for ticker in target_tickers:
@@ -119,43 +86,32 @@ def main():
         # Add ETF ticker column for visualization
         df_current['etf_ticker'] = ticker
         
-        # Get previous for changes
-        import sqlite3
-        conn = sqlite3.connect("etf_data.db")
-        c = conn.cursor()
-        c.execute(f"SELECT DISTINCT date FROM holdings_{ticker} ORDER BY date DESC LIMIT 2")
-        dates = [row[0] for row in c.fetchall()]
-        conn.close()
-        
-        df_prev = None
-        if len(dates) > 1:
-            df_prev = get_holdings(dates[1], ticker)
+        # Changes from the previous snapshot, diffed when it was saved
+        diffs = get_holding_changes(last_date, ticker)
+        options = analyze_options(df_current, as_of=last_date)
         
-        # 1. Positions Image
-        display_df = df_current.copy()
-        if df_prev is not None:
-             merged = pd.merge(display_df, df_prev[['holding_ticker', 'shares']], on='holding_ticker', how='left', suffixes=('', '_prev'))
-             merged['shares_prev'] = merged['shares_prev'].fillna(0)
-             merged['shares_change'] = merged['shares'] - merged['shares_prev']
-             display_df = merged
-        else:
-             display_df['shares_change'] = 0
-             
-        img_bytes = TableVisualizer.generate_image(display_df, title=f"{ticker} Holdings ({last_date})", date_str=last_date)
-        if img_bytes:
-            fname = f"positions_report_{ticker}_{last_date}.png"
-            with open(fname, "wb") as f: f.write(img_bytes)
-            print(f"Saved {fname}")
+        # Per-ETF images are only re-rendered when the snapshot changed
+        render_images = ticker not in unchanged
+
+        if render_images:
+            # 1. Positions Image
+            display_df = df_current.copy()
+            display_df['shares_change'] = position_changes(df_current, diffs)
+
+            img_bytes = TableVisualizer.generate_image(display_df, title=f"{ticker} Holdings ({last_date})", date_str=last_date)
+            if img_bytes:
+                fname = f"positions_report_{ticker}_{last_date}.png"
+                with open(fname, "wb") as f: f.write(img_bytes)
+                print(f"Saved {fname}")
+
+            # 2. Options Image
+            img_bytes_opt = TableVisualizer.generate_options_image(df_current, title=f"{ticker} Options ({last_date})", date_str=last_date, analysis=options)
+            if img_bytes_opt:
+                fname = f"options_report_{ticker}_{last_date}.png"
+                with open(fname, "wb") as f: f.write(img_bytes_opt)
+                print(f"Saved {fname}")
 
-        # 2. Options Image
-        img_bytes_opt = TableVisualizer.generate_options_image(df_current, title=f"{ticker} Options ({last_date})", date_str=last_date)
-        if img_bytes_opt:
-            fname = f"options_report_{ticker}_{last_date}.png"
-            with open(fname, "wb") as f: f.write(img_bytes_opt)
-            print(f"Saved {fname}")
-            
         # 3. Changes Image
-        diffs = compare_holdings(df_current, df_prev)
         # Add ETF ticker to diffs for aggregation
         for key in diffs:
             if not diffs[key].empty:
@@ -163,22 +119,25 @@ def main():
                 diffs[key]['etf_ticker'] = ticker
                 all_diffs_collection[key].append(diffs[key])
         
-        img_bytes_chg = TableVisualizer.generate_changes_image(diffs, title=f"{ticker} Changes ({last_date})", date_str=last_date)
-        if img_bytes_chg:
-            fname = f"combined_report_{ticker}_{last_date}.png"
-            with open(fname, "wb") as f: f.write(img_bytes_chg)
-            print(f"Saved {fname}")
+        if render_images:
+            img_bytes_chg = TableVisualizer.generate_changes_image(diffs, title=f"{ticker} Changes ({last_date})", date_str=last_date)
+            if img_bytes_chg:
+                fname = f"combined_report_{ticker}_{last_date}.png"
+                with open(fname, "wb") as f: f.write(img_bytes_chg)
+                print(f"Saved {fname}")
 
         # Collect for consolidated options report
         all_current_holdings.append(df_current)
+        all_options.append(options)
 
-    # 7. Generate Consolidated Reports
+    # 6. Generate Consolidated Reports
     if all_current_holdings:
         print("\nGenerating Consolidated Reports...")
         
         # Consolidated Options Report
         combined_df = pd.concat(all_current_holdings, ignore_index=True)
-        img_bytes_all_opt = TableVisualizer.generate_options_image(combined_df, title=f"All ETFs Options ({today})", date_str=today)
+        combined_options = OptionsAnalysis.concat(all_options)
+        img_bytes_all_opt = TableVisualizer.generate_options_image(combined_df, title=f"All ETFs Options ({today})", date_str=today, analysis=combined_options)
         if img_bytes_all_opt:
             fname_all_opt = f"all_options_report_{today}.png"
             with open(fname_all_opt, "wb") as f: f.write(img_bytes_all_opt)
@@ -226,4 +185,8 @@ def main():
             print("No option changes detected for separate report.")
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        shutdown_browser_pool()
+        close_db_connection()
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+import pandas as pd
+from config import ETFS, SCRAPE_MAX_CONCURRENCY, SCRAPE_TIMEOUT, BROWSER_POOL_SIZE
+from database import get_last_payload_hash
+from scrapers import get_scraper, get_http_client
+
+@dataclass
+class ScrapeResult:
+    ticker: str
+    df: pd.DataFrame = None
+    error: str = None
+    elapsed: float = 0.0
+    payload_hash: str = None
+    # True when the issuer file is byte-identical to the last stored snapshot
+    unchanged: bool = False
+
+    @property
+    def ok(self):
+        return self.error is None and self.df is not None and not self.df.empty
+
+    def summary(self):
+        """One-line status used by main.py and the bot."""
+        if self.unchanged:
+            return f"{self.ticker}: Unchanged since last snapshot ({self.elapsed:.1f}s)"
+        if self.ok:
+            return f"{self.ticker}: Success ({len(self.df)} records, {self.elapsed:.1f}s)"
+        if self.error:
+            return f"{self.ticker}: Error ({self.error})"
+        return f"{self.ticker}: Failed (Empty Data)"
+
+
+async def _call(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+async def _run_one(ticker, scraper, slots, lane, timeout):
+    # The lane first: a browser scraper waiting for the pool holds no slot an HTTP one could use
+    async with lane, slots:
+        start = time.perf_counter()
+        try:
+            df = await asyncio.wait_for(scraper.fetch_holdings_async(), timeout)
+            return ScrapeResult(
+                ticker, df=df, elapsed=time.perf_counter() - start,
+                payload_hash=scraper.payload_hash, unchanged=scraper.unchanged
+            )
+        except asyncio.TimeoutError:
+            return ScrapeResult(ticker, error=f"Timed out after {timeout}s", elapsed=time.perf_counter() - start)
+        except Exception as e:
+            return ScrapeResult(ticker, error=str(e), elapsed=time.perf_counter() - start)
+
+
+async def scrape_all(tickers=None, max_concurrency=SCRAPE_MAX_CONCURRENCY, timeout=SCRAPE_TIMEOUT, skip_unchanged=True, db_run=None):
+    """
+    Scrape several ETFs concurrently and return {ticker: ScrapeResult} in input order.
+
+    Scrapers are awaited directly on the caller's event loop (no thread per scrape), at
+    most max_concurrency at once. Browser scrapers also queue in their own lane, capped at
+    the browser pool size, so the fast HTTP scrapers never wait behind Playwright.
+    With skip_unchanged, a payload identical to the last stored snapshot is not parsed
+    and comes back as an `unchanged` result with no frame.
+    db_run awaits a database call, e.g. the bot's get_db_worker().run; by default the
+    last payload hashes are read directly, before any scraper starts.
+    """
+    tickers = list(ETFS.keys()) if tickers is None else tickers
+    slots = asyncio.Semaphore(max_concurrency)
+    browser_lane = asyncio.Semaphore(max(1, min(max_concurrency, BROWSER_POOL_SIZE)))
+
+    results = {}
+    scrapers = {}
+    for ticker in tickers:
+        scraper = get_scraper(ETFS[ticker]["scraper_class"]) if ticker in ETFS else None
+        if scraper is None:
+            results[ticker] = ScrapeResult(ticker, error="No scraper defined")
+            continue
+        if skip_unchanged:
+            scraper.last_payload_hash = await (db_run or _call)(get_last_payload_hash, ticker)
+        scrapers[ticker] = scraper
+
+    tasks = {}
+    for ticker, scraper in scrapers.items():
+        lane = browser_lane if scraper.USES_BROWSER else nullcontext()
+        tasks[ticker] = asyncio.create_task(_run_one(ticker, scraper, slots, lane, timeout))
+
+    start = time.perf_counter()
+    for ticker, result in zip(tasks, await asyncio.gather(*tasks.values())):
+        results[ticker] = result
+
+    print(f"Scraped {len(tasks)} ETFs in {time.perf_counter() - start:.1f}s")
+    return {t: results[t] for t in tickers}
+
+
+def scrape_all_sync(tickers=None, **kwargs):
+    """Blocking wrapper around scrape_all for scripts without an event loop."""
+    async def run():
+        try:
+            return await scrape_all(tickers, **kwargs)
+        finally:
+            await get_http_client().aclose()
+
+    return asyncio.run(run())
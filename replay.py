@@ -0,0 +1,375 @@
+import hashlib
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import numpy as np
+import openpyxl
+import config
+from endpoint_cache import save_endpoint
+
+# Offline stand-in for the issuer sites.
+#
+#   python replay.py record [dir]        scrape the live sites, saving every raw payload to dir
+#   python replay.py synth [dir] [rows]  write synthetic fixtures in each issuer's format
+#   python replay.py serve [dir] [port]  serve fixtures from dir and print the env overrides
+#
+# Fixtures are named after the scraper that reads them: QQQI.csv, GPIQ.xlsx, QYLD.csv, QDTE.csv.
+
+FIXTURE_FILES = {
+    "QQQI": "QQQI.csv",
+    "GPIQ": "GPIQ.xlsx",
+    "QYLD": "QYLD.csv",
+    "QDTE": "QDTE.csv",
+}
+
+CONTENT_TYPES = {
+    ".csv": "text/csv",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# Minimal pages with the elements the browser scrapers look for
+GPIQ_PAGE = """<!DOCTYPE html>
+<html><body>
+<h1>GPIQ Holdings</h1>
+<div id="holdings">Loading...</div>
+<button id="download" onclick="window.location.href='/gs/gpiq/download.xlsx'">All Holdings <span>download</span></button>
+<script>
+fetch('/gs/gpiq/holdings').then(r => r.json()).then(d => {
+  document.getElementById('holdings').textContent = d.count + ' holdings';
+});
+</script>
+</body></html>
+"""
+
+QDTE_PAGE = """<!DOCTYPE html>
+<html><body>
+<h1>QDTE Holdings</h1>
+<a id="csvlink" href="/roundhill/qdte.csv" download>Download CSV</a>
+</body></html>
+"""
+
+
+class ReplayServer:
+    """
+    Local HTTP server that replays recorded (or synthetic) issuer payloads.
+
+    Routes mirror the live sites closely enough for every scraper, including the
+    pages the browser scrapers drive. Slow issuers are simulated with `delay`
+    (seconds before the response headers) and `throttle` (body bytes per second);
+    failures with `fail_first` (the first N requests to each path) and `fail_rate`
+    (random fraction of requests), both answered with `fail_status`.
+    """
+
+    def __init__(self, fixtures_dir=config.FIXTURES_DIR, port=0, delay=0.0, throttle=None,
+                 fail_status=503, fail_rate=0.0, fail_first=0, etags=True, seed=0):
+        self.fixtures_dir = fixtures_dir
+        self.port = port
+        self.delay = delay
+        self.throttle = throttle
+        self.fail_status = fail_status
+        self.fail_rate = fail_rate
+        self.fail_first = fail_first
+        self.etags = etags
+        self.requests = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="replay-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _route(self, path):
+        """Return (body, content_type, is_download) for a request path, or None for 404."""
+        if path == "/neos/admin-ajax.php":
+            return self._fixture("QQQI", download=False)
+        if path.startswith("/globalx/") and path.endswith(".csv"):
+            return self._fixture("QYLD", download=False)
+        if path == "/gs/gpiq":
+            return GPIQ_PAGE.encode(), "text/html", False
+        if path == "/gs/gpiq/holdings":
+            return b'{"count": 1}', "application/json", False
+        if path == "/gs/gpiq/download.xlsx":
+            return self._fixture("GPIQ", download=True)
+        if path == "/roundhill/qdte":
+            return QDTE_PAGE.encode(), "text/html", False
+        if path == "/roundhill/qdte.csv":
+            return self._fixture("QDTE", download=True)
+        return None
+
+    def _fixture(self, ticker, download):
+        path = os.path.join(self.fixtures_dir, FIXTURE_FILES[ticker])
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            body = f.read()
+        return body, CONTENT_TYPES[os.path.splitext(path)[1]], download
+
+    def _should_fail(self, path):
+        with self._lock:
+            count = self.requests.get(path, 0) + 1
+            self.requests[path] = count
+            return count <= self.fail_first or self._random.random() < self.fail_rate
+
+    def _handle(self, handler):
+        path = urlsplit(handler.path).path
+        failing = self._should_fail(path)
+        if self.delay:
+            time.sleep(self.delay)
+
+        if failing:
+            handler.send_error(self.fail_status)
+            return
+
+        routed = self._route(path)
+        if routed is None:
+            handler.send_error(404)
+            return
+
+        body, content_type, download = routed
+        etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"' if self.etags else None
+        if etag and handler.headers.get("If-None-Match") == etag:
+            handler.send_response(304)
+            handler.send_header("ETag", etag)
+            handler.end_headers()
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        if etag:
+            handler.send_header("ETag", etag)
+        if download:
+            handler.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+        handler.end_headers()
+        self._write_body(handler, body)
+
+    def _write_body(self, handler, body):
+        if not self.throttle:
+            handler.wfile.write(body)
+            return
+        # Send ~10 chunks a second at the throttled rate
+        chunk = max(1, int(self.throttle / 10))
+        for i in range(0, len(body), chunk):
+            handler.wfile.write(body[i:i + chunk])
+            handler.wfile.flush()
+            time.sleep(chunk / self.throttle)
+
+
+def replay_urls(base_url):
+    """Map each URL setting in config.py to its route on a ReplayServer."""
+    return {
+        "QQQI_AJAX_URL": f"{base_url}/neos/admin-ajax.php",
+        "GPIQ_HOLDINGS_URL": f"{base_url}/gs/gpiq",
+        "QYLD_HOLDINGS_URL_BASE": f"{base_url}/globalx/qyld_full-holdings_{{date}}.csv",
+        "QDTE_HOLDINGS_URL": f"{base_url}/roundhill/qdte",
+    }
+
+
+def point_config_at(base_url, endpoint_cache_path=None, seed_endpoints=True):
+    """
+    Repoint the scraper URLs in config at a ReplayServer, in this process.
+    The endpoint cache and HTTP validators are moved to throwaway files so the real ones
+    are never touched; with seed_endpoints, GPIQ and QDTE get their download URLs
+    pre-cached and skip the browser.
+    """
+    for name, url in replay_urls(base_url).items():
+        setattr(config, name, url)
+
+    if endpoint_cache_path is None:
+        fd, endpoint_cache_path = tempfile.mkstemp(prefix="replay_endpoints_", suffix=".json")
+        os.close(fd)
+        os.remove(endpoint_cache_path)
+    config.ENDPOINT_CACHE_PATH = endpoint_cache_path
+    fd, config.HTTP_VALIDATORS_PATH = tempfile.mkstemp(prefix="replay_validators_", suffix=".json")
+    os.close(fd)
+    os.remove(config.HTTP_VALIDATORS_PATH)
+
+    if seed_endpoints:
+        save_endpoint("GPIQ", f"{base_url}/gs/gpiq/download.xlsx", {})
+        save_endpoint("QDTE", f"{base_url}/roundhill/qdte.csv", {})
+    return endpoint_cache_path
+
+
+# Synthetic fixtures, in the layout each issuer publishes
+
+def _synthetic_legs(n_rows, seed):
+    rng = np.random.default_rng(seed)
+    is_option = rng.random(n_rows) < 0.1
+    strikes = rng.integers(15000, 25000, n_rows)
+    days = rng.integers(1, 28, n_rows)
+    months = rng.integers(1, 12, n_rows)
+    shares = rng.integers(1, 50000, n_rows)
+    prices = rng.uniform(5, 900, n_rows).round(2)
+    return is_option, strikes, days, months, shares, prices
+
+
+def synth_qqqi(n_rows, seed=0):
+    is_option, strikes, days, months, shares, prices = _synthetic_legs(n_rows, seed)
+    lines = ["Date,Fund Ticker,Ticker,CUSIP,Description,Shares,Price,Market Value,Weight,Net Assets,Total Shares,Cash Component,"]
+    for i in range(n_rows):
+        if is_option[i]:
+            ticker = f"NDX US {months[i]:02d}/{days[i]:02d}/25 C{strikes[i]}"
+            shares_i = -int(shares[i] % 500 + 1)
+        else:
+            ticker, shares_i = f"EQ{i}", int(shares[i])
+        mv = shares_i * prices[i]
+        lines.append(
+            f'12/01/2025,QQQI,{ticker},C{i:08d},Holding {i},"{shares_i:,}",${prices[i]:.2f},'
+            f'"${mv:,.2f}",{100 / n_rows:.4f}%,"$2,000,000,000.00","40,000,000",0,'
+        )
+    return ("\n".join(lines) + "\n").encode()
+
+
+def synth_qyld(n_rows, seed=1):
+    is_option, strikes, days, months, shares, prices = _synthetic_legs(n_rows, seed)
+    lines = ["Global X Nasdaq 100 Covered Call ETF", "Holdings as of 12/01/2025",
+             "% of Net Assets,Name,Ticker,Market Value ($),Shares Held"]
+    for i in range(n_rows):
+        if is_option[i]:
+            ticker = f"NDX US {months[i]:02d}/{days[i]:02d}/25 C{strikes[i]}"
+            shares_i = -int(shares[i] % 500 + 1)
+        else:
+            ticker, shares_i = f"EQ{i}", int(shares[i])
+        lines.append(f'{100 / n_rows:.4f},Holding {i},{ticker},"{shares_i * prices[i]:,.2f}","{shares_i:,}"')
+    return ("\n".join(lines) + "\n").encode()
+
+
+def synth_qdte(n_rows, seed=2):
+    is_option, strikes, days, months, shares, prices = _synthetic_legs(n_rows, seed)
+    lines = ["Date,Ticker,Name,Shares,Market Value,Weight"]
+    for i in range(n_rows):
+        if is_option[i]:
+            ticker = f"4NDX 26{months[i]:02d}{days[i]:02d}C{strikes[i] * 1000:08d}"
+            shares_i = -int(shares[i] % 500 + 1)
+        else:
+            ticker, shares_i = f"EQ{i}", int(shares[i])
+        lines.append(f'2025-12-01,{ticker},Holding {i},{shares_i},{shares_i * prices[i]:.2f},{100 / n_rows:.2f}%')
+    return ("\n".join(lines) + "\n").encode()
+
+
+def synth_gpiq(n_rows, seed=3):
+    is_option, strikes, days, months, shares, prices = _synthetic_legs(n_rows, seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Holdings")
+    sheet.append(["Goldman Sachs Nasdaq-100 Premium Income ETF"])
+    sheet.append(["Ticker", "Security Name", "Asset Class", "Shares", "Market Value", "Weight (%)"])
+    for i in range(n_rows):
+        if is_option[i]:
+            strike = strikes[i] / 40
+            desc = f"C/QQQ FLEX {months[i]:02d}/{days[i]:02d}/2026 {strike:.1f} EXP 2026-{months[i]:02d}-{days[i]:02d}"
+            row = [None, desc, "Option", -int(shares[i] % 500 + 1)]
+        else:
+            row = [f"EQ{i}", f"Holding {i}", "Equity", int(shares[i])]
+        row += [float(row[3] * prices[i]), 100 / n_rows]
+        sheet.append(row)
+    buf = io.BytesIO()
+    workbook.save(buf)
+    return buf.getvalue()
+
+
+SYNTHESIZERS = {
+    "QQQI": synth_qqqi,
+    "GPIQ": synth_gpiq,
+    "QYLD": synth_qyld,
+    "QDTE": synth_qdte,
+}
+
+def write_synthetic_fixtures(fixtures_dir=config.FIXTURES_DIR, n_rows=500):
+    os.makedirs(fixtures_dir, exist_ok=True)
+    for ticker, synth in SYNTHESIZERS.items():
+        path = os.path.join(fixtures_dir, FIXTURE_FILES[ticker])
+        with open(path, "wb") as f:
+            f.write(synth(n_rows))
+        print(f"Wrote {path}")
+
+
+def record_fixtures(fixtures_dir=config.FIXTURES_DIR):
+    """Scrape the live sites once, saving every raw payload to fixtures_dir."""
+    from orchestrator import scrape_all_sync
+    from browser import shutdown_browser_pool
+
+    config.FIXTURE_RECORD_DIR = fixtures_dir
+    try:
+        results = scrape_all_sync(skip_unchanged=False)
+    finally:
+        shutdown_browser_pool()
+    for result in results.values():
+        print(result.summary())
+
+
+def serve(fixtures_dir=config.FIXTURES_DIR, port=8765):
+    server = ReplayServer(fixtures_dir, port=port).start()
+    # The same throwaway endpoint cache (seeded with the replayed downloads) as point_config_at,
+    # so GPIQ and QDTE never reuse endpoints cached from the live sites
+    point_config_at(server.base_url)
+    overrides = {
+        **replay_urls(server.base_url),
+        "ENDPOINT_CACHE_PATH": config.ENDPOINT_CACHE_PATH,
+        "HTTP_VALIDATORS_PATH": config.HTTP_VALIDATORS_PATH,
+    }
+    print(f"Replaying {fixtures_dir} on {server.base_url}. Point the scrapers at it with:")
+    for name, value in overrides.items():
+        print(f'  export {name}="{value}"')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+        for path in (config.ENDPOINT_CACHE_PATH, config.HTTP_VALIDATORS_PATH):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("record", "synth", "serve"):
+        print("Usage: python replay.py record [dir] | synth [dir] [rows] | serve [dir] [port]")
+        return
+    command, args = sys.argv[1], sys.argv[2:]
+    fixtures_dir = args[0] if args else config.FIXTURES_DIR
+    if command == "record":
+        record_fixtures(fixtures_dir)
+    elif command == "synth":
+        write_synthetic_fixtures(fixtures_dir, int(args[1]) if len(args) > 1 else 500)
+    else:
+        serve(fixtures_dir, int(args[1]) if len(args) > 1 else 8765)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,81 @@
+import os
+from dataclasses import dataclass
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
+from jinja2 import Environment
 from config import ETFS
 
+# What makes two rows the same instrument across snapshots. Ticker alone is not enough:
+# option legs can share one (e.g. the index) across strikes and expiries.
+INSTRUMENT_KEY_COLUMNS = ['holding_ticker', 'option_type', 'strike_price', 'expiration_date']
+# Columns reported side by side for positions held on both days
+CHANGE_COLUMNS = ['shares', 'market_value', 'weight']
+
+def _key_values(df, col):
+    if col not in df.columns:
+        return pd.Series(None, index=df.index, dtype=object)
+    values = df[col]
+    if col == 'holding_ticker' and 'description' in df.columns:
+        # Cash lines and some option legs have no ticker
+        values = values.fillna(df['description'])
+    if col == 'strike_price':
+        # Floats factorize far faster than objects, and 500 matches 500.0
+        return pd.to_numeric(values, errors='coerce').astype(float)
+    return values.astype(object)
+
+def instrument_keys(df):
+    """
+    Canonical text of each row's INSTRUMENT_KEY_COLUMNS (missing values empty), as stored
+    in securities.security_key: equal keys mean the same instrument. Built per distinct
+    value of each column, not per row.
+    """
+    keys = np.full(len(df), '', dtype=object)
+    for i, col in enumerate(INSTRUMENT_KEY_COLUMNS):
+        codes, uniques = pd.factorize(_key_values(df, col), use_na_sentinel=False)
+        text = np.asarray(uniques, dtype=object)
+        text[pd.isna(text)] = ''
+        text = text.astype(str).astype(object)[codes]
+        keys = text if i == 0 else keys + '\x1f' + text
+    return pd.Series(keys, index=df.index, dtype=object)
+
+def _key_codes(*frames):
+    """One integer per row of the frames (concatenated): equal codes mean the same instrument."""
+    codes = np.zeros(sum(len(df) for df in frames), dtype=np.int64)
+    for col in INSTRUMENT_KEY_COLUMNS:
+        values = pd.concat([_key_values(df, col) for df in frames], ignore_index=True)
+        col_codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        # Re-factorize the combined code so it stays below the row count
+        codes = pd.factorize(codes * (len(uniques) + 1) + col_codes)[0]
+    return codes
+
+def instrument_codes(today_df, yesterday_df):
+    """
+    Integer keys for the rows of both frames: equal codes mean the same instrument
+    (INSTRUMENT_KEY_COLUMNS) and the same occurrence of it, so repeated lines pair up
+    one to one instead of multiplying.
+    """
+    codes = _key_codes(today_df, yesterday_df)
+    today_codes, yesterday_codes = codes[:len(today_df)], codes[len(today_df):]
+    if not (pd.Index(today_codes).has_duplicates or pd.Index(yesterday_codes).has_duplicates):
+        return today_codes, yesterday_codes
+    today_occ = pd.Series(today_codes).groupby(today_codes).cumcount().to_numpy()
+    yesterday_occ = pd.Series(yesterday_codes).groupby(yesterday_codes).cumcount().to_numpy()
+    width = max(today_occ.max(initial=0), yesterday_occ.max(initial=0)) + 1
+    return today_codes * width + today_occ, yesterday_codes * width + yesterday_occ
+
+def _numeric(df, col, rows):
+    if col not in df.columns:
+        return np.full(len(rows), np.nan)
+    return pd.to_numeric(df[col].iloc[rows], errors='coerce').to_numpy(dtype=float)
+
 def compare_holdings(today_df, yesterday_df):
     """
-    Compare two dataframes of holdings.
+    Compare two dataframes of holdings, matching rows by instrument (ticker, option
+    type, strike and expiry).
     Returns a dictionary with 'new', 'sold', 'increased', 'decreased', 'unchanged' dataframes.
+    'new' and 'sold' have today's columns; the others add <col>_today / <col>_yesterday
+    for CHANGE_COLUMNS and shares_change. Rows keep today's (for sold, yesterday's) order.
     """
     if yesterday_df is None or yesterday_df.empty:
         return {
@@ -16,257 +86,463 @@ def compare_holdings(today_df, yesterday_df):
             'unchanged': pd.DataFrame(columns=today_df.columns)
         }
 
-    # Ensure unique key for merge (Ticker)
-    # If ticker is missing, use Description? Better to rely on Ticker if possible.
-    
-    # Merge on holding_ticker
-    merged = pd.merge(
-        today_df, 
-        yesterday_df, 
-        on='holding_ticker', 
-        how='outer', 
-        suffixes=('_today', '_yesterday'),
-        indicator=True
-    )
-    
-    # New Positions (Left only)
-    new_holdings = merged[merged['_merge'] == 'left_only'].copy()
-    # Clean up columns
-    for col in today_df.columns:
-        if col + '_today' in new_holdings.columns:
-            new_holdings[col] = new_holdings[col + '_today']
-    new_holdings = new_holdings[today_df.columns]
-
-    # Sold Positions (Right only)
-    sold_holdings = merged[merged['_merge'] == 'right_only'].copy()
-    for col in today_df.columns:
-        if col + '_yesterday' in sold_holdings.columns:
-            sold_holdings[col] = sold_holdings[col + '_yesterday']
-    sold_holdings = sold_holdings[today_df.columns]
-
-    # Commons
-    common = merged[merged['_merge'] == 'both'].copy()
-    
-    # Calculate Change in Shares
-    common['shares_change'] = common['shares_today'] - common['shares_yesterday']
-    
-    increased = common[common['shares_change'] > 0].copy()
-    decreased = common[common['shares_change'] < 0].copy()
-    unchanged = common[common['shares_change'] == 0].copy()
-    
-    # Restore standard columns for report
-    for df_subset in [increased, decreased, unchanged]:
-        for col in today_df.columns:
-            if col + '_today' in df_subset.columns:
-                df_subset[col] = df_subset[col + '_today']
-        # Keep shares_change
-    
+    # Hash join on the integer keys: where each of today's rows sits in yesterday's frame
+    today_keys, yesterday_keys = instrument_codes(today_df, yesterday_df)
+    match = pd.Index(yesterday_keys).get_indexer(today_keys)
+    held = match >= 0
+    sold = np.ones(len(yesterday_df), dtype=bool)
+    sold[match[held]] = False
+
+    today_rows = np.flatnonzero(held)
+    yesterday_rows = match[held]
+    common = today_df.iloc[today_rows]
+    for col in CHANGE_COLUMNS:
+        common[col + '_today'] = _numeric(today_df, col, today_rows)
+        common[col + '_yesterday'] = _numeric(yesterday_df, col, yesterday_rows)
+    change = common['shares_today'].to_numpy() - common['shares_yesterday'].to_numpy()
+    common['shares_change'] = change
+
     return {
-        'new': new_holdings,
-        'sold': sold_holdings,
-        'increased': increased,
-        'decreased': decreased,
-        'unchanged': unchanged
+        'new': today_df.iloc[np.flatnonzero(~held)],
+        'sold': yesterday_df.iloc[np.flatnonzero(sold)].reindex(columns=today_df.columns),
+        # NaN changes (shares missing on either day) fall in none of the three
+        'increased': common[change > 0],
+        'decreased': common[change < 0],
+        'unchanged': common[change == 0]
     }
 
-def analyze_options(df):
+def position_changes(current_df, diffs):
     """
-    Analyze options positions to determine upper and lower bounds.
-    Assumes NEOS/Income ETFs sell covered calls (Upper Bound) or Puts (Lower Bound).
+    shares_change for each row of current_df (a snapshot with security_id) from its diffs
+    against the previous one: new positions count in full, rows not in diffs as 0.
     """
-    options = df[df['asset_class'] == 'Option'].copy()
-    
-    if options.empty:
-        return "No Options Positions Found", None, None
+    new = diffs['new'].assign(shares_change=pd.to_numeric(diffs['new']['shares'], errors='coerce'))
+    changed = pd.concat([new, diffs['increased'], diffs['decreased']])
+    by_security = changed['shares_change'].astype(float).groupby(changed['security_id']).sum()
+    return current_df['security_id'].map(by_security).fillna(0)
 
-    # Sort by expiration
-    options['expiration_date'] = pd.to_datetime(options['expiration_date'], errors='coerce')
-    options = options.sort_values('expiration_date')
-    
-    report_lines = []
-    
-    # Group by Expiration
-    lower_bound = None
-    upper_bound = None
-    
-    for exp_date, group in options.groupby('expiration_date'):
-        exp_str = exp_date.strftime('%Y-%m-%d') if pd.notnull(exp_date) else "Unknown Date"
-        header = f"### Expiration: {exp_str}"
-        report_lines.append(header)
-        
-        calls = group[group['option_type'] == 'Call']
-        puts = group[group['option_type'] == 'Put']
-        
-        # In Income ETFs:
-        # Short Call usually defines the Capped Upside (Upper Bound)
-        # Short Put usually defines the entry point or Lower Bound
-        # But QQQI might be different (Call Spread? Just Short Call?)
-        
-        if not calls.empty:
-            # Assuming short calls (negative shares? or just presence in this list implies short for these ETFs?)
-            # Usually holdings show positive shares for long, negative for short?
-            # Or just list the position.
-            # Let's assume the ETF writes calls.
-            # Max strike call is the cap? Or min strike call?
-            # Usually they sell OTM calls.
-            
-            # Simple Stat: Range of Strikes
-            min_call = calls['strike_price'].min()
-            max_call = calls['strike_price'].max()
-            report_lines.append(f"- Calls: Strike Range {min_call} - {max_call}")
-            
-            if upper_bound is None: upper_bound = min_call # Conservative cap
-
-        if not puts.empty:
-            min_put = puts['strike_price'].min()
-            max_put = puts['strike_price'].max()
-            report_lines.append(f"- Puts: Strike Range {min_put} - {max_put}")
-            
-            if lower_bound is None: lower_bound = max_put # Conservative floor
-            
-    summary = "\n".join(report_lines)
-    return summary, lower_bound, upper_bound
-
-def generate_report(today_date, etf_ticker, diffs, options_summary):
+def holding_window(history, dates):
     """
-    Generate a markdown report string.
+    Summarize an ETF's holdings over consecutive snapshots in one pass, as returned by
+    database.get_holdings_window(): `dates` oldest first, `history` one row per holding
+    per date. Returns one row per instrument (lots summed), in the file order of the
+    last snapshot that held it, with its descriptive columns and:
+
+    first_seen / last_seen: first and last dates held within the window
+    days_held: snapshots held; streak: consecutive snapshots held up to last_seen
+    <col>: CHANGE_COLUMNS on last_seen; <col>_today / <col>_yesterday: on the last and
+    first dates (NaN when not held); shares_change: shares_today - shares_yesterday,
+    counting not held as 0; shares_traded: sum of absolute day-over-day share changes
+    status: 'new', 'sold', 'increased', 'decreased', 'unchanged' comparing the first and
+    last dates, or 'transient' if held only in between
+    """
+    n_days = len(dates)
+    if history.empty:
+        return history.drop(columns=['date']).assign(status=pd.Series(dtype=object))
+    keys = _key_codes(history)
+    instruments, inst = np.unique(keys, return_inverse=True)
+    day = np.searchsorted(np.asarray(dates, dtype=object), history['date'].to_numpy(dtype=object))
+    shape = (len(instruments), n_days)
+
+    held = np.zeros(shape, dtype=bool)
+    held[inst, day] = True
+    values = {}
+    for col in CHANGE_COLUMNS:
+        grid = np.zeros(shape)
+        np.add.at(grid, (inst, day), pd.to_numeric(history[col], errors='coerce').fillna(0).to_numpy(dtype=float))
+        values[col] = grid
+
+    first = held.argmax(axis=1)
+    last = n_days - 1 - held[:, ::-1].argmax(axis=1)
+    # run[i, d]: consecutive snapshots instrument i has been held as of date d
+    run = np.zeros(shape, dtype=np.int64)
+    run[:, 0] = held[:, 0]
+    for d in range(1, n_days):
+        run[:, d] = (run[:, d - 1] + 1) * held[:, d]
+    rows = np.arange(len(instruments))
+
+    # The instrument's last row in the window: history is ordered by date
+    last_row = pd.Series(np.arange(len(history))).groupby(inst).max().to_numpy()
+    summary = history.iloc[last_row].drop(columns=['date'])
+    dates_array = np.asarray(dates, dtype=object)
+    summary['first_seen'] = dates_array[first]
+    summary['last_seen'] = dates_array[last]
+    summary['days_held'] = held.sum(axis=1)
+    summary['streak'] = run[rows, last]
+    for col, grid in values.items():
+        summary[col] = grid[rows, last]
+        summary[col + '_today'] = np.where(held[:, -1], grid[:, -1], np.nan)
+        summary[col + '_yesterday'] = np.where(held[:, 0], grid[:, 0], np.nan)
+    shares = values['shares']
+    summary['shares_change'] = shares[:, -1] - shares[:, 0]
+    summary['shares_traded'] = np.abs(np.diff(shares, axis=1)).sum(axis=1)
+
+    change = summary['shares_change'].to_numpy()
+    summary['status'] = np.select(
+        [held[:, 0] & held[:, -1] & (change > 0), held[:, 0] & held[:, -1] & (change < 0),
+         held[:, 0] & held[:, -1], held[:, -1], held[:, 0]],
+        ['increased', 'decreased', 'unchanged', 'new', 'sold'],
+        default='transient'
+    )
+    return summary.iloc[np.argsort(last_row, kind='stable')]
+
+def window_changes(summary):
+    """
+    Split holding_window() output by status: compare_holdings() for the first and last
+    snapshots of the window (same keys and columns), plus 'transient'.
+    """
+    status = summary['status']
+    return {key: summary[status == key] for key in ['new', 'sold', 'increased', 'decreased', 'unchanged', 'transient']}
+
+def generate_window_report(etf_ticker, dates, summary, limit=15):
+    """
+    Generate a short markdown summary of holding_window() output: counts per status and
+    how long each current option leg has been held.
     """
     report = []
-    report.append(f"# Daily Holdings Report: {etf_ticker} ({today_date})")
-    
-    # Options Section
-    report.append("## Options Analysis (Bounds)")
-    if options_summary[0]:
-        report.append(options_summary[0])
-        report.append(f"\n**Estimated Lower Bound:** {options_summary[1]}")
-        report.append(f"**Estimated Upper Bound:** {options_summary[2]}")
-    else:
-        report.append("No options data available.")
-
-    # Changes Section
-    report.append("\n## Position Changes")
-    
-    if not diffs['new'].empty:
-        report.append(f"### 🟢 New Positions ({len(diffs['new'])})")
-        report.append(diffs['new'][['holding_ticker', 'description', 'shares', 'weight']].to_markdown(index=False))
-    
-    if not diffs['sold'].empty:
-        report.append(f"### 🔴 Sold Positions ({len(diffs['sold'])})")
-        report.append(diffs['sold'][['holding_ticker', 'description', 'shares']].to_markdown(index=False))
-        
-    if not diffs['increased'].empty:
-        report.append(f"### 🔼 Increased Positions ({len(diffs['increased'])})")
-        # specific formatting for readability
-        view = diffs['increased'][['holding_ticker', 'description', 'shares_today', 'shares_change']]
-        report.append(view.head(10).to_markdown(index=False))
-        if len(view) > 10: report.append(f"... and {len(view)-10} more.")
-
-    if not diffs['decreased'].empty:
-        report.append(f"### 🔽 Decreased Positions ({len(diffs['decreased'])})")
-        view = diffs['decreased'][['holding_ticker', 'description', 'shares_today', 'shares_change']]
-        report.append(view.head(10).to_markdown(index=False))
-        if len(view) > 10: report.append(f"... and {len(view)-10} more.")
+    report.append(f"# {etf_ticker}: {dates[0]} to {dates[-1]} ({len(dates)} snapshots)")
+    counts = summary['status'].value_counts()
+    report.append(", ".join(f"{counts.get(key, 0)} {key}" for key in ['new', 'sold', 'increased', 'decreased', 'unchanged', 'transient']))
+
+    options = summary[(summary['asset_class'] == 'Option') & (summary['last_seen'] == dates[-1])]
+    if options.empty:
+        report.append("No options held on the last snapshot.")
+        return "\n".join(report)
 
+    options = options.sort_values(['streak', 'expiration_date'], ascending=[False, True])
+    view = options[['holding_ticker', 'option_type', 'strike_price', 'expiration_date', 'first_seen', 'streak', 'shares_change']]
+    report.append(f"\n## Options Held ({len(options)})")
+    report.append(view.head(limit).to_markdown(index=False))
+    if len(view) > limit: report.append(f"... and {len(view)-limit} more.")
     return "\n".join(report)
 
-def generate_options_only_report(today_date, etf_ticker, diffs, options_summary, current_df):
+# Contracts are quoted per option; notional is strike x contracts x multiplier
+OPTION_MULTIPLIER = 100
+
+@dataclass
+class OptionsAnalysis:
     """
-    Generate a markdown report focused exclusively on options positions.
-    Filters out all equity/stock holdings and only shows option-related changes.
+    Options analytics from analyze_options(). Each row of `expiries` is one (etf,
+    expiration_date) pair, in expiry order, with columns:
+    calls, puts (legs); call/put_strike_min, call/put_strike_max; call/put_contracts;
+    call/put_avg_strike (weighted by contracts); notional, market_value; days_to_expiry.
+    `bounds` has one row per ETF: upper_bound is the lowest call strike of the nearest
+    expiry with calls (the cap of the written calls), lower_bound the highest put strike
+    of the nearest expiry with puts. Missing figures are NaN.
     """
-    report = []
-    report.append(f"# Options-Only Report: {etf_ticker} ({today_date})")
-    
-    # Current Options Positions
-    report.append("\n## Current Options Positions")
-    options_df = current_df[current_df['asset_class'] == 'Option'].copy()
-    
-    if not options_df.empty:
-        # Select relevant columns for options display
-        # Use market_value for GPIQ, shares for others
-        if etf_ticker == 'GPIQ':
-            display_cols = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date', 'market_value', 'weight']
+    expiries: pd.DataFrame
+    bounds: pd.DataFrame
+
+    @property
+    def empty(self):
+        return self.expiries.empty
+
+    @classmethod
+    def concat(cls, analyses):
+        """One OptionsAnalysis from several, e.g. one per ETF."""
+        analyses = list(analyses)
+        if not analyses:
+            return analyze_options(pd.DataFrame())
+        return cls(pd.concat([a.expiries for a in analyses]), pd.concat([a.bounds for a in analyses]))
+
+    def bound(self, etf_ticker=None):
+        """(lower_bound, upper_bound) of one ETF (default: the only one); None where it has no such options."""
+        if etf_ticker is None and len(self.bounds) == 1:
+            row = self.bounds.iloc[0]
+        elif etf_ticker in self.bounds.index:
+            row = self.bounds.loc[etf_ticker]
         else:
-            display_cols = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date', 'shares', 'weight']
-        
-        available_cols = [col for col in display_cols if col in options_df.columns]
-        report.append(options_df[available_cols].to_markdown(index=False))
-        report.append(f"\n**Total Options Positions:** {len(options_df)}")
+            return None, None
+        return tuple(None if pd.isna(row[col]) else float(row[col]) for col in ('lower_bound', 'upper_bound'))
+
+def _expiry_dates(values):
+    # Issuers format expiries differently; parse each distinct string once, whatever its format
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), errors='coerce', format='mixed')
+    return parsed.reindex(codes).to_numpy()
+
+def analyze_options(df, etf_ticker=None, as_of=None):
+    """
+    Analyze options positions to determine upper and lower bounds, per ETF and expiry.
+    Assumes NEOS/Income ETFs sell covered calls (Upper Bound) or Puts (Lower Bound).
+    The ETF of each row is its etf_ticker column if there is one (several ETFs can be
+    analyzed at once), else `etf_ticker`. Days to expiry count from `as_of` ('YYYY-MM-DD';
+    default the frame's date column, else today). Returns an OptionsAnalysis.
+    """
+    options = df[df['asset_class'] == 'Option'] if 'asset_class' in df.columns else df.iloc[:0]
+    if 'etf_ticker' not in options.columns:
+        options = options.assign(etf_ticker=etf_ticker)
+    # Missing columns become NaN
+    options = options.reindex(columns=['etf_ticker', 'date', 'option_type', 'strike_price', 'expiration_date', 'shares', 'market_value'])
+    if as_of is None:
+        as_of = options['date'].max() if options['date'].notna().any() else None
+    as_of = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+
+    strike = pd.to_numeric(options['strike_price'], errors='coerce').to_numpy(dtype=float)
+    contracts = pd.to_numeric(options['shares'], errors='coerce').abs().to_numpy(dtype=float)
+    option_type = options['option_type'].to_numpy(dtype=object)
+    is_call, is_put = option_type == 'Call', option_type == 'Put'
+    weighted = strike * contracts
+    frame = pd.DataFrame({
+        'etf': options['etf_ticker'].to_numpy(dtype=object),
+        'expiration_date': _expiry_dates(options['expiration_date']),
+        'call_strike': np.where(is_call, strike, np.nan),
+        'put_strike': np.where(is_put, strike, np.nan),
+        'call_contracts': np.where(is_call, contracts, np.nan),
+        'put_contracts': np.where(is_put, contracts, np.nan),
+        'call_weighted': np.where(is_call, weighted, np.nan),
+        'put_weighted': np.where(is_put, weighted, np.nan),
+        'notional': weighted * OPTION_MULTIPLIER,
+        'market_value': pd.to_numeric(options['market_value'], errors='coerce').to_numpy(dtype=float),
+    })
+
+    # One pass over the legs; a NaT expiry is kept as its own group, sorted last
+    expiries = frame.groupby(['etf', 'expiration_date'], sort=True, dropna=False).agg(
+        calls=('call_strike', 'count'),
+        puts=('put_strike', 'count'),
+        call_strike_min=('call_strike', 'min'),
+        call_strike_max=('call_strike', 'max'),
+        put_strike_min=('put_strike', 'min'),
+        put_strike_max=('put_strike', 'max'),
+        call_contracts=('call_contracts', 'sum'),
+        put_contracts=('put_contracts', 'sum'),
+        call_weighted=('call_weighted', 'sum'),
+        put_weighted=('put_weighted', 'sum'),
+        notional=('notional', 'sum'),
+        market_value=('market_value', 'sum'),
+    )
+    for side in ('call', 'put'):
+        contracts_held = expiries[f'{side}_contracts']
+        expiries[f'{side}_avg_strike'] = expiries.pop(f'{side}_weighted') / contracts_held.where(contracts_held > 0)
+    expiries['days_to_expiry'] = (expiries.index.get_level_values('expiration_date') - as_of.normalize()).days
+
+    # groupby().first() skips NaN: the nearest expiry that has calls (puts)
+    # dropna=False: legs of an unnamed ETF (no etf_ticker given) still get bounds
+    by_etf = expiries.groupby(level='etf', sort=False, dropna=False)
+    bounds = pd.DataFrame({
+        'lower_bound': by_etf['put_strike_max'].first(),
+        'upper_bound': by_etf['call_strike_min'].first(),
+    })
+    return OptionsAnalysis(expiries, bounds)
+
+def format_options_analysis(analysis, etf_ticker=None):
+    """Markdown lines per expiry (of one ETF, or all) for an OptionsAnalysis."""
+    expiries = analysis.expiries
+    if etf_ticker is not None:
+        expiries = expiries[expiries.index.get_level_values('etf') == etf_ticker]
+    report_lines = []
+    for (etf, exp_date), row in expiries.iterrows():
+        exp_str = exp_date.strftime('%Y-%m-%d') if pd.notnull(exp_date) else "Unknown Date"
+        days = f" ({row['days_to_expiry']:.0f} days)" if pd.notnull(row['days_to_expiry']) else ""
+        report_lines.append(f"### Expiration: {exp_str}{days}")
+        for side, label in (('call', 'Calls'), ('put', 'Puts')):
+            if not row[f'{side}s']:
+                continue
+            line = f"- {label}: Strike Range {row[f'{side}_strike_min']} - {row[f'{side}_strike_max']}"
+            if pd.notnull(row[f'{side}_avg_strike']):
+                line += f", avg {row[f'{side}_avg_strike']:,.2f} over {row[f'{side}_contracts']:,.0f} contracts"
+            report_lines.append(line)
+        if row['notional']:
+            report_lines.append(f"- Notional: ${row['notional']:,.0f}")
+    return "\n".join(report_lines)
+
+# Markdown reports. main.py writes three documents per run (combined, options-only and
+# positions-only); ReportWriter filters and projects each ETF's frames once, formats each
+# table's cells once, and streams all three through templates compiled at import.
+
+# Issuers that report options by market value rather than contracts
+VALUE_COLUMN = {'GPIQ': 'market_value'}
+OPTION_COLUMNS = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date']
+# Rows shown per increased/decreased table in the combined report
+CHANGES_SHOWN = 10
+# Between ETFs in a report file; each rendered document already ends in a newline
+REPORT_SEPARATOR = "\n---\n\n"
+
+_templates = Environment(trim_blocks=True, lstrip_blocks=True, keep_trailing_newline=True)
+
+_SECTIONS = """
+{%- macro sections(items) %}
+{% for section in items %}
+### {{ section.title }} ({{ section.count }})
+{% for line in section.table %}
+{{ line }}
+{% endfor %}
+{% if section.more %}
+... and {{ section.more }} more.
+{% endif %}
+{% endfor %}
+{% endmacro %}
+"""
+
+REPORT_TEMPLATE = _templates.from_string(_SECTIONS + """\
+# Daily Holdings Report: {{ etf }} ({{ date }})
+## Options Analysis (Bounds)
+{% if options is not none %}
+{{ options }}
+
+**Estimated Lower Bound:** {{ lower_bound }}
+**Estimated Upper Bound:** {{ upper_bound }}
+{% else %}
+No options data available.
+{% endif %}
+
+## Position Changes
+{{ sections(changes) }}""")
+
+OPTIONS_TEMPLATE = _templates.from_string(_SECTIONS + """\
+# Options-Only Report: {{ etf }} ({{ date }})
+
+## Current Options Positions
+{% if positions.count %}
+{% for line in positions %}
+{{ line }}
+{% endfor %}
+
+**Total Options Positions:** {{ positions.count }}
+{% else %}
+No current options positions.
+{% endif %}
+
+## Options Position Changes
+{% if option_changes %}
+{{ sections(option_changes) }}
+{%- else %}
+No options position changes detected.
+{% endif %}""")
+
+POSITIONS_TEMPLATE = _templates.from_string("""\
+# Options Positions: {{ etf }} ({{ date }})
+{% if positions.count %}
+{% for line in positions %}
+{{ line }}
+{% endfor %}
+
+**Total Options Positions:** {{ positions.count }}
+{% else %}
+No current options positions.
+{% endif %}""")
+
+def _cells(values):
+    """(markdown cells, numeric) for one column: numbers as %g like tabulate, missing values blank."""
+    if pd.api.types.is_bool_dtype(values):
+        return [str(v) for v in values.tolist()], False
+    if pd.api.types.is_numeric_dtype(values):
+        numbers = values
     else:
-        report.append("No current options positions.")
-    
-    # Options Changes Section
-    report.append("\n## Options Position Changes")
-    
-    # Filter each diff category to only include options
-    new_options = diffs['new'][diffs['new']['asset_class'] == 'Option'] if 'asset_class' in diffs['new'].columns else pd.DataFrame()
-    sold_options = diffs['sold'][diffs['sold']['asset_class'] == 'Option'] if 'asset_class' in diffs['sold'].columns else pd.DataFrame()
-    increased_options = diffs['increased'][diffs['increased']['asset_class'] == 'Option'] if 'asset_class' in diffs['increased'].columns else pd.DataFrame()
-    decreased_options = diffs['decreased'][diffs['decreased']['asset_class'] == 'Option'] if 'asset_class' in diffs['decreased'].columns else pd.DataFrame()
-    
-    if not new_options.empty:
-        report.append(f"### 🟢 New Options ({len(new_options)})")
-        if etf_ticker == 'GPIQ':
-            display_cols = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date', 'market_value']
-        else:
-            display_cols = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date', 'shares']
-        available_cols = [col for col in display_cols if col in new_options.columns]
-        report.append(new_options[available_cols].to_markdown(index=False))
-    
-    if not sold_options.empty:
-        report.append(f"### 🔴 Closed Options ({len(sold_options)})")
-        if etf_ticker == 'GPIQ':
-            display_cols = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date', 'market_value']
-        else:
-            display_cols = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date', 'shares']
-        available_cols = [col for col in display_cols if col in sold_options.columns]
-        report.append(sold_options[available_cols].to_markdown(index=False))
-        
-    if not increased_options.empty:
-        report.append(f"### 🔼 Increased Options ({len(increased_options)})")
-        if etf_ticker == 'GPIQ':
-            display_cols = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date', 'market_value']
-        else:
-            display_cols = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date', 'shares_today', 'shares_change']
-        available_cols = [col for col in display_cols if col in increased_options.columns]
-        report.append(increased_options[available_cols].to_markdown(index=False))
-
-    if not decreased_options.empty:
-        report.append(f"### 🔽 Decreased Options ({len(decreased_options)})")
-        if etf_ticker == 'GPIQ':
-            display_cols = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date', 'market_value']
-        else:
-            display_cols = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date', 'shares_today', 'shares_change']
-        available_cols = [col for col in display_cols if col in decreased_options.columns]
-        report.append(decreased_options[available_cols].to_markdown(index=False))
-    
-    if new_options.empty and sold_options.empty and increased_options.empty and decreased_options.empty:
-        report.append("No options position changes detected.")
+        # Object columns (e.g. strikes read back from SQLite) are numeric if every value parses
+        numbers = pd.to_numeric(values, errors='coerce')
+        if not 0 < numbers.notna().sum() == values.notna().sum():
+            return ['' if v is None or v != v else str(v) for v in values.tolist()], False
+    if pd.api.types.is_integer_dtype(numbers):
+        return [str(v) for v in numbers.tolist()], True
+    return ['' if v != v else format(v, 'g') for v in numbers.tolist()], True
 
-    return "\n".join(report)
+class MarkdownTable:
+    """Columns of a frame formatted once as a pipe table; iterate for its lines, as often as needed."""
 
-def generate_positions_only_report(today_date, etf_ticker, current_df):
+    def __init__(self, df, columns, limit=None):
+        columns = [col for col in columns if col in df.columns]
+        rows = df.iloc[:limit] if limit is not None else df
+        cells, numeric = zip(*(_cells(rows[col]) for col in columns)) if columns else ((), ())
+        self.count = len(df)
+        self._header = "| " + " | ".join(columns) + " |"
+        self._rule = "|" + "|".join("---:" if n else ":---" for n in numeric) + "|"
+        self._cells = cells
+
+    def __iter__(self):
+        yield self._header
+        yield self._rule
+        for row in zip(*self._cells):
+            yield "| " + " | ".join(row) + " |"
+
+def _section(title, df, columns, limit=None):
+    more = len(df) - limit if limit is not None and len(df) > limit else 0
+    return {'title': title, 'count': len(df), 'table': MarkdownTable(df, columns, limit), 'more': more}
+
+def _is_option(df):
+    return df['asset_class'] == 'Option' if 'asset_class' in df.columns else pd.Series(False, index=df.index)
+
+def report_context(today_date, etf_ticker, diffs, options, current_df=None):
     """
-    Generate a minimal report showing ONLY the current options positions table.
-    No analysis, no changes, just the positions.
+    Everything the three report templates need for one ETF: the option rows of each frame
+    are selected once and each table is formatted once (the current options table is
+    shared by the options-only and positions-only reports).
     """
-    report = []
-    report.append(f"# Options Positions: {etf_ticker} ({today_date})")
-    
-    options_df = current_df[current_df['asset_class'] == 'Option'].copy()
-    
-    if not options_df.empty:
-        # Select relevant columns for options display
-        # Use market_value for GPIQ, shares for others
-        if etf_ticker == 'GPIQ':
-            display_cols = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date', 'market_value', 'weight']
-        else:
-            display_cols = ['holding_ticker', 'description', 'option_type', 'strike_price', 'expiration_date', 'shares', 'weight']
-        
-        available_cols = [col for col in display_cols if col in options_df.columns]
-        report.append(options_df[available_cols].to_markdown(index=False))
-        report.append(f"\n**Total Options Positions:** {len(options_df)}")
+    value = VALUE_COLUMN.get(etf_ticker, 'shares')
+    option_diffs = {key: df[_is_option(df)] for key, df in diffs.items()}
+    if value == 'shares':
+        option_change_columns = OPTION_COLUMNS + ['shares_today', 'shares_change']
     else:
-        report.append("No current options positions.")
+        option_change_columns = OPTION_COLUMNS + [value]
 
-    return "\n".join(report)
+    changes = [
+        _section("🟢 New Positions", diffs['new'], ['holding_ticker', 'description', 'shares', 'weight']),
+        _section("🔴 Sold Positions", diffs['sold'], ['holding_ticker', 'description', 'shares']),
+        _section("🔼 Increased Positions", diffs['increased'], ['holding_ticker', 'description', 'shares_today', 'shares_change'], CHANGES_SHOWN),
+        _section("🔽 Decreased Positions", diffs['decreased'], ['holding_ticker', 'description', 'shares_today', 'shares_change'], CHANGES_SHOWN),
+    ]
+    option_changes = [
+        _section("🟢 New Options", option_diffs['new'], OPTION_COLUMNS + [value]),
+        _section("🔴 Closed Options", option_diffs['sold'], OPTION_COLUMNS + [value]),
+        _section("🔼 Increased Options", option_diffs['increased'], option_change_columns),
+        _section("🔽 Decreased Options", option_diffs['decreased'], option_change_columns),
+    ]
+    if current_df is not None:
+        positions = MarkdownTable(current_df[_is_option(current_df)], OPTION_COLUMNS + [value, 'weight'])
+    else:
+        positions = None
+    lower_bound, upper_bound = options.bound(etf_ticker)
+    return {
+        'etf': etf_ticker,
+        'date': today_date,
+        'options': format_options_analysis(options, etf_ticker) if not options.empty else None,
+        'lower_bound': lower_bound,
+        'upper_bound': upper_bound,
+        'changes': [s for s in changes if s['count']],
+        'option_changes': [s for s in option_changes if s['count']],
+        'positions': positions,
+    }
+
+class ReportWriter:
+    """
+    Streams the combined, options-only and positions-only markdown reports of a run to
+    their files, one ETF at a time, separated by rules:
+
+        with ReportWriter(today) as writer:
+            writer.add(ticker, diffs, options, df_current)
+
+    The files are created by the first add(); `paths` lists them once written.
+    """
+    FILES = {
+        'report': "combined_report_{date}.md",
+        'options': "options_only_report_{date}.md",
+        'positions': "positions_only_report_{date}.md",
+    }
+    TEMPLATES = {'report': REPORT_TEMPLATE, 'options': OPTIONS_TEMPLATE, 'positions': POSITIONS_TEMPLATE}
+
+    def __init__(self, today_date, directory=""):
+        self.today_date = today_date
+        self.directory = directory
+        self.paths = []
+        self._files = None
+
+    def add(self, etf_ticker, diffs, options, current_df):
+        context = report_context(self.today_date, etf_ticker, diffs, options, current_df)
+        if self._files is None:
+            self.paths = [os.path.join(self.directory, name.format(date=self.today_date)) for name in self.FILES.values()]
+            self._files = {key: open(path, "w") for key, path in zip(self.FILES, self.paths)}
+        else:
+            for f in self._files.values():
+                f.write(REPORT_SEPARATOR)
+        for key, f in self._files.items():
+            self.TEMPLATES[key].stream(context).dump(f)
+
+    def close(self):
+        for f in (self._files or {}).values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,8 +1,9 @@
 import pandas as pd
-from playwright.sync_api import sync_playwright
+from browser import get_browser_pool
 import io
 import os
 from jinja2 import Template
+from report import analyze_options
 
 class TableVisualizer:
     TEMPLATE = """
@@ -182,6 +183,8 @@ class TableVisualizer:
             .option-type-call { color: #137333; font-weight: 500; }
             .option-type-put { color: #c5221f; font-weight: 500; }
             .etf-cell { font-weight: 700; color: #202124; background-color: #f1f3f4; border-radius: 4px; padding: 4px 8px; font-size: 12px; }
+            .bounds { margin-bottom: 10px; color: #5f6368; font-size: 14px; }
+            .summary { margin-bottom: 20px; }
         </style>
     </head>
     <body>
@@ -189,6 +192,39 @@ class TableVisualizer:
             <div class="header-title">{{ title }}</div>
             <div class="header-date">{{ date }}</div>
         </div>
+        {% for row in bounds %}
+        <div class="bounds"><span class="etf-cell">{{ row.etf_ticker }}</span> Lower Bound: <b>{{ row.lower_bound }}</b> &middot; Upper Bound: <b>{{ row.upper_bound }}</b></div>
+        {% endfor %}
+        {% if expiries %}
+        <table class="summary">
+            <thead>
+                <tr>
+                    <th>ETF</th>
+                    <th>Expiration</th>
+                    <th class="numeric">Days</th>
+                    <th class="numeric">Call Strikes</th>
+                    <th class="numeric">Avg Call</th>
+                    <th class="numeric">Put Strikes</th>
+                    <th class="numeric">Avg Put</th>
+                    <th class="numeric">Notional</th>
+                </tr>
+            </thead>
+            <tbody>
+                {% for row in expiries %}
+                <tr>
+                    <td><span class="etf-cell">{{ row.etf_ticker }}</span></td>
+                    <td>{{ row.expiration_date }}</td>
+                    <td class="numeric">{{ row.days }}</td>
+                    <td class="numeric option-type-call">{{ row.calls }}</td>
+                    <td class="numeric">{{ row.call_avg }}</td>
+                    <td class="numeric option-type-put">{{ row.puts }}</td>
+                    <td class="numeric">{{ row.put_avg }}</td>
+                    <td class="numeric">{{ row.notional }}</td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+        {% endif %}
         <table>
             <thead>
                 <tr>
@@ -326,16 +362,16 @@ class TableVisualizer:
     </html>
     """
 
+    @staticmethod
+    async def _screenshot(page, html_content):
+        await page.set_content(html_content)
+        body = page.locator("body")
+        return await body.screenshot()
+
     @staticmethod
     def _render_and_screenshot(html_content):
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            page.set_content(html_content)
-            body = page.locator("body")
-            image_bytes = body.screenshot()
-            browser.close()
-            return image_bytes
+        # Reuse the process-wide Chromium instead of cold-starting one per image
+        return get_browser_pool().run(TableVisualizer._screenshot, html_content)
 
     @staticmethod
     def generate_image(df, title="Holdings Report", date_str=""):
@@ -366,7 +402,47 @@ class TableVisualizer:
         return TableVisualizer._render_and_screenshot(html_content)
 
     @staticmethod
-    def generate_options_image(df, title="Options Report", date_str=""):
+    def _options_summary(analysis):
+        """Bounds and per-expiry rows of an OptionsAnalysis, formatted for OPTIONS_TEMPLATE."""
+        def number(value, fmt="{:,.2f}"):
+            return "" if pd.isna(value) else fmt.format(value)
+
+        def strikes(row, side):
+            if not row[f'{side}s']:
+                return ""
+            low, high = row[f'{side}_strike_min'], row[f'{side}_strike_max']
+            return number(low) if low == high else f"{number(low)} - {number(high)}"
+
+        def etf_name(etf):
+            # Frames analyzed without an ETF ticker group under a NaN ETF
+            return "" if pd.isna(etf) else etf
+
+        bounds = [
+            {'etf_ticker': etf_name(etf), 'lower_bound': number(row['lower_bound']), 'upper_bound': number(row['upper_bound'])}
+            for etf, row in analysis.bounds.iterrows()
+        ]
+        expiries = [
+            {
+                'etf_ticker': etf_name(etf),
+                'expiration_date': expiry.strftime('%Y-%m-%d') if pd.notnull(expiry) else "Unknown",
+                'days': number(row['days_to_expiry'], "{:.0f}"),
+                'calls': strikes(row, 'call'),
+                'call_avg': number(row['call_avg_strike']),
+                'puts': strikes(row, 'put'),
+                'put_avg': number(row['put_avg_strike']),
+                'notional': number(row['notional'] or None, "${:,.0f}"),
+            }
+            for (etf, expiry), row in analysis.expiries.iterrows()
+        ]
+        return bounds, expiries
+
+    @staticmethod
+    def generate_options_image(df, title="Options Report", date_str="", analysis=None):
+        # analysis: the frame's OptionsAnalysis, if the caller already has it
+        if analysis is None:
+            analysis = analyze_options(df, as_of=date_str or None)
+        bounds, expiries = TableVisualizer._options_summary(analysis)
+
         # Filter for options if not already done, or assume caller passes options df
         if 'asset_class' in df.columns:
             df = df[df['asset_class'] == 'Option'].copy()
@@ -387,7 +463,7 @@ class TableVisualizer:
             
         rows = df.to_dict('records')
         template = Template(TableVisualizer.OPTIONS_TEMPLATE)
-        html_content = template.render(title=title, date=date_str, rows=rows)
+        html_content = template.render(title=title, date=date_str, rows=rows, bounds=bounds, expiries=expiries)
         
         return TableVisualizer._render_and_screenshot(html_content)
 